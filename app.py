@@ -1,169 +1,288 @@
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, redirect, url_for, jsonify, g, Response
 from cli import (
-    get_summoner_by_riot_id, get_analysis_data_for_summoner,
-    init_db, get_match_timeline_cached, get_match_details_cached,
-    analyze_minions, analyze_kill_participation, analyze_first_structure,
-    analyze_assists, analyze_scuttle_crabs, analyze_ability_uses,
-    analyze_total_damage, analyze_timeCCingOthers,  # Added analyze_timeCCingOthers
-    get_champion, get_game_mode,
-    store_analysis_result
+    get_summoner_by_riot_id, query_analysis_page, ANALYSIS_COLUMNS,
+    init_db, get_all_summoners_from_db, get_summoner_puuids
 )
-from datetime import datetime
-from config import API_KEY, load_custom_summoners, save_custom_summoner
-import pandas as pd
-import requests
-import sqlite3
+from roster import load_roster, save_summoner
+from jobs import submit_job, get_job
+from stats import get_summoner_stats
+from series import get_match_series
+from memory_cache import get_cache_stats
+from riot_client import get_scheduler_stats
+from config import TRACE_HISTORY
+import metrics
 
 app = Flask(__name__)
 
-def get_all_summoners_from_db():
-    conn = sqlite3.connect("riot_cache.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT summoner_name FROM analysis")
-    results = cursor.fetchall()
-    conn.close()
+# Table headers, in the order of cli.ANALYSIS_COLUMNS
+COLUMN_HEADERS = {
+    'summoner_name': 'Summoner',
+    'match_id': 'Match ID',
+    'game_datetime': 'Date & Time',
+    'game_duration': 'Duration',
+    'champion': 'Champion',
+    'gameMode': 'Mode',
+    'minions_at_10': 'Minions @10',
+    'kill_participation': 'KP%',
+    'first_structure_ts': '1st Tower',
+    'assists': 'Assists',
+    'scuttle_crabs': 'Crabs',
+    'abilityUses': 'Abilities',
+    'total_damage_dealt': 'Damage',
+    'time_ccing_others': 'CC Time (s)',
+}
 
-    return sorted(set(row[0] for row in results))
+def format_analysis_page(df):
+    """Format one page of analysis rows for display, column by column (no per-row Python calls)."""
+    # Imported here, like pandas in cli.query_analysis_page: pages that render no table start faster
+    import numpy as np
+
+    # Format duration from seconds to mm:ss
+    seconds = df['game_duration'].fillna(0).astype(int)
+    df['game_duration'] = (seconds // 60).astype(str) + "m" + (seconds % 60).astype(str).str.zfill(2) + "s"
+
+    # Format KP% as xx.xx%
+    df['kill_participation'] = np.char.mod("%.2f%%", df['kill_participation'].fillna(0).to_numpy(dtype=float))
+
+    # Format first tower time from ms to ss:ms
+    ms = df['first_structure_ts'].fillna(0).astype(int)
+    df['first_structure_ts'] = ((ms // 1000).astype(str) + "s" + (ms % 1000).astype(str).str.zfill(3) + "ms").where(
+        ms > 0, "N/A"
+    )
+
+    # Format damage with thousands separator using space
+    damage = df['total_damage_dealt'].fillna(0).astype(int).astype(str)
+    df['total_damage_dealt'] = damage.str[::-1].str.replace(r"(\d{3})(?=\d)", r"\1 ", regex=True).str[::-1]
+
+    # Format time CCing others as seconds
+    df['time_ccing_others'] = df['time_ccing_others'].fillna(0).astype(int).astype(str) + "s"
+    return df
+
+@app.before_request
+def start_request_trace():
+    g.trace, g.trace_token = metrics.start_trace(f"{request.method} {request.url_rule or 'unmatched'}")
+
+@app.after_request
+def add_server_timing(response):
+    # Per-stage totals of this request, shown in the browser's network panel
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers['Server-Timing'] = ", ".join(
+            f"{stage.replace(':', '-')};dur={seconds * 1000:.1f}" for stage, (_, seconds) in trace.totals().items()
+        )
+        response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+@app.teardown_request
+def finish_request_trace(exc):
+    if g.get('trace') is not None:
+        metrics.finish_trace(g.trace, g.trace_token)
+        g.trace = None
+
+def resolve_summoner(form):
+    """
+    (summoner_name, puuid) from a submitted form: either the manual Riot ID
+    (looked up via the API and remembered) or the selected dropdown entry.
+    Raises ValueError with a user-facing message if it cannot be resolved.
+    """
+    if form.get('manual_mode') == 'on':
+        game_name = form.get('game_name', '').strip()
+        tag_line = form.get('tag_line', '').strip()
+        if not game_name or not tag_line:
+            raise ValueError("Missing Riot ID (gameName and tagLine).")
+        summoner_data = get_summoner_by_riot_id(game_name, tag_line)
+
+        if not summoner_data:
+            raise ValueError("Summoner not found or invalid Riot ID.")
+
+        puuid = summoner_data["puuid"]
+        summoner_name = summoner_data["gameName"]
+
+        save_summoner(summoner_name, puuid)
+        return summoner_name, puuid
+
+    puuid = form.get('puuid')
+    summoner_name = form.get('summoner_name')
+
+    if not puuid or not summoner_name:
+        raise ValueError("Invalid summoner selected.")
+
+    return summoner_name, puuid
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    result_table = None
     error = None
-    dropdown_summoners = load_custom_summoners()
+    init_db()
+    dropdown_summoners = load_roster()
 
     if request.method == 'POST':
         count = int(request.form.get('count', 3))
-        manual_mode = request.form.get('manual_mode') == 'on'
 
         try:
-            init_db()
-
-            if manual_mode:
-                game_name = request.form.get('game_name', '').strip()
-                tag_line = request.form.get('tag_line', '').strip()
-                if not game_name or not tag_line:
-                    raise ValueError("Missing Riot ID (gameName and tagLine).")
-                summoner_data = get_summoner_by_riot_id(game_name, tag_line)
-
-                if not summoner_data:
-                    error = "Summoner not found or invalid Riot ID."
-                    return render_template("index.html", summoners=dropdown_summoners, result=None, error=error)
-
-                puuid = summoner_data["puuid"]
-                summoner_name = summoner_data["gameName"]
-
-                save_custom_summoner(summoner_name, puuid)
-                dropdown_summoners[summoner_name] = {"name": summoner_name, "puuid": puuid}
-            else:
-                puuid = request.form.get('puuid')
-                summoner_name = request.form.get('summoner_name')
-
-                if not puuid or not summoner_name:
-                    raise ValueError("Invalid summoner selected.")
-
-                if not puuid:
-                    # Try to fetch puuid using Riot ID if it's missing (from DB summoners)
-                    raise ValueError(f"No puuid available for {summoner_name}. Please analyze manually first.")
-
-            # Get match list
-            url = f'https://europe.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids?count={count}'
-            headers = {'X-Riot-Token': API_KEY}
-            match_ids = requests.get(url, headers=headers).json()
-
-            for mid in match_ids:
-                timeline = get_match_timeline_cached(mid)
-                match_details = get_match_details_cached(mid)
-
-                minions_10 = analyze_minions(timeline, puuid)
-                kill_part = analyze_kill_participation(match_details, puuid)
-                first_struct = analyze_first_structure(timeline, match_details, puuid)
-                assists = analyze_assists(match_details, puuid)
-                scuttles = analyze_scuttle_crabs(match_details, puuid)
-                ability_uses = analyze_ability_uses(match_details, puuid)
-                total_damage = analyze_total_damage(match_details, puuid)
-                time_ccing_others = analyze_timeCCingOthers(match_details, puuid)  # Fix: Correct function call
-                champion = get_champion(match_details, puuid)
-                game_mode = get_game_mode(match_details)
-                game_duration = match_details['info'].get('gameDuration', 0)
-                game_dt = match_details['info'].get('gameStartTimestamp', 0)
-                game_dt_readable = datetime.fromtimestamp(game_dt / 1000).strftime("%Y-%m-%d %H:%M:%S")
-
-                store_analysis_result(
-                    summoner_name,
-                    mid,
-                    game_dt_readable,
-                    game_duration,
-                    champion,
-                    game_mode,
-                    minions_10,
-                    kill_part,
-                    first_struct if first_struct else 0,
-                    assists,
-                    scuttles,
-                    ability_uses,
-                    total_damage,
-                    time_ccing_others  # Fix: Ensure correct variable is passed
-                )
-
-            df = get_analysis_data_for_summoner(summoner_name)
-            
-            # Format duration from seconds to mm:ss
-            df['game_duration'] = df['game_duration'].apply(
-                lambda s: f"{s // 60}m{s % 60:02d}s" if s else "0m00s"
-            )
-
-            # Format KP% as xx.xx%
-            df['kill_participation'] = df['kill_participation'].apply(
-                lambda x: f"{x:.2f}%" if x else "0.00%"
-            )
-
-            # Format first tower time from ms to ss:ms
-            df['first_structure_ts'] = df['first_structure_ts'].apply(
-                lambda ms: f"{int(ms // 1000)}s{int(ms % 1000):03d}ms" if ms else "N/A"
-            )
-
-            # Format damage with thousands separator using space
-            df['total_damage_dealt'] = df['total_damage_dealt'].apply(
-                lambda d: f"{int(d):,}".replace(",", " ") if d else "0"
-            )
-
-            # Format time CCing others as seconds
-            df['time_ccing_others'] = df['time_ccing_others'].apply(  # Fix: Ensure correct column name is used
-                lambda s: f"{s}s" if s else "0s"
-            )
-            
-            df.rename(columns={
-                'summoner_name': 'Summoner',
-                'match_id': 'Match ID',
-                'game_datetime': 'Date & Time',
-                'game_duration': 'Duration',
-                'champion': 'Champion',
-                'gameMode': 'Mode',
-                'minions_at_10': 'Minions @10',
-                'kill_participation': 'KP%',
-                'first_structure_ts': '1st Tower',
-                'assists': 'Assists',
-                'scuttle_crabs': 'Crabs',
-                'abilityUses': 'Abilities',
-                'total_damage_dealt': 'Damage',
-                'time_ccing_others': 'CC Time (s)',  # Add new column name
-            }, inplace=True)
-
-            result_table = df.to_html(classes="table table-bordered", index=False, border=0, justify="center")
-
+            summoner_name, puuid = resolve_summoner(request.form)
+            # The analysis runs in the background; the page polls the job until it is done
+            job_id = submit_job(summoner_name, puuid, count)
+            return redirect(url_for('index', job=job_id))
         except Exception as e:
             error = str(e)
 
-    # After form POST or normal GET, load extra names from DB
+    # After form POST or normal GET, load extra names from DB; their puuids come
+    # from their stored rows (or the Riot IDs seen in stored matches), so selecting
+    # one needs no account lookup
     try:
-        db_names = get_all_summoners_from_db()
+        db_names = [name for name in get_all_summoners_from_db() if name not in dropdown_summoners]
+        known = get_summoner_puuids(db_names)
         for name in db_names:
-            if name not in dropdown_summoners:
-                dropdown_summoners[name] = {"name": name, "puuid": None}
+            dropdown_summoners[name] = {"name": name, "puuid": known.get(name)}
     except Exception:
         pass
 
-    return render_template("index.html", summoners=dropdown_summoners, result=result_table, error=error)
+    with metrics.stage("render"):
+        return render_template("index.html", summoners=dropdown_summoners,
+                               job_id=request.args.get('job'), error=error,
+                               columns=[COLUMN_HEADERS[c] for c in ANALYSIS_COLUMNS])
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Submit an analysis job (same fields as the form on '/'); identical in-flight jobs are merged."""
+    form = request.get_json(silent=True) or request.form
+    try:
+        init_db()
+        summoner_name, puuid = resolve_summoner(form)
+        job_id = submit_job(summoner_name, puuid, int(form.get('count', 3)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "job_id": job_id,
+        "status_url": url_for('job_status', job_id=job_id),
+        "result_url": url_for('job_result', job_id=job_id),
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    init_db()
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job."}), 404
+    del job["result"]
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    init_db()
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job."}), 404
+    if job["status"] == "failed":
+        return jsonify({"status": job["status"], "error": job["error"]}), 500
+    if job["status"] != "done":
+        return jsonify({"status": job["status"], "completed": job["completed"], "total": job["total"]}), 409
+    return jsonify({
+        "status": job["status"],
+        "summoner_name": job["summoner_name"],
+        "match_ids": job["result"]["match_ids"],
+        "failures": job["result"]["failures"],
+        "data_url": url_for('analysis_rows', summoner=job["summoner_name"]),
+    })
+
+@app.route('/api/analysis')
+def analysis_rows():
+    """
+    Analysis rows of one summoner for DataTables server-side processing: paging
+    (start/length), sorting (order[0][column|dir]), global and per-column search
+    run in SQL, and only the returned page is formatted.
+    """
+    args = request.args
+    summoner_name = args.get('summoner', '')
+    try:
+        order_index = int(args.get('order[0][column]', 2))
+        column_search = dict(
+            (column, args.get(f'columns[{i}][search][value]', ''))
+            for i, column in enumerate(ANALYSIS_COLUMNS)
+        )
+        with metrics.stage("query"):
+            records_total, records_filtered, df = query_analysis_page(
+                summoner_name,
+                start=int(args.get('start', 0)),
+                length=int(args.get('length', 10)),
+                order_column=ANALYSIS_COLUMNS[order_index] if 0 <= order_index < len(ANALYSIS_COLUMNS) else None,
+                order_dir=args.get('order[0][dir]', 'desc'),
+                search=args.get('search[value]', ''),
+                column_search=column_search,
+            )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with metrics.stage("format"):
+        data = format_analysis_page(df).values.tolist()
+    return jsonify({
+        "draw": int(args.get('draw', 0)),
+        "recordsTotal": records_total,
+        "recordsFiltered": records_filtered,
+        "data": data,
+    })
+
+@app.route('/api/stats/<summoner_name>')
+def summoner_stats(summoner_name):
+    """Count / mean / std of the main metrics overall, per champion, per mode and over the last N games."""
+    init_db()
+    return jsonify(get_summoner_stats(summoner_name))
+
+@app.route('/api/series/<match_id>')
+def match_series(match_id):
+    """
+    Per-minute gold / XP / CS / position arrays and position heatmaps of every
+    participant of a match. Series never change once stored, so clients and proxies
+    may cache them; a matching If-None-Match gets a 304.
+    """
+    init_db()
+    with metrics.stage("query"):
+        found = get_match_series(match_id)
+    if found is None:
+        return jsonify({"error": "No series stored for this match."}), 404
+    payload, etag = found
+    with metrics.stage("format"):
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response.make_conditional(request)
+
+@app.route('/api/cache-stats')
+def cache_stats():
+    """Entries, bytes and hit / miss / eviction counters of this worker's in-memory cache."""
+    return jsonify(get_cache_stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage histograms, counters, API scheduler and memory cache numbers of this worker (Prometheus text format)."""
+    api_stats = get_scheduler_stats()
+    cache_stats = get_cache_stats()
+    gauges = {
+        "memory_cache_bytes": cache_stats["bytes"],
+        "memory_cache_entries": cache_stats["entries"],
+    }
+    # Running totals since the worker started: exported as counters (*_total)
+    counters = {
+        "riot_wait_seconds": dict(
+            ((("region", region),), stats["wait_seconds"]) for region, stats in api_stats["regions"].items()
+        ),
+        "riot_rate_limited": dict(
+            ((("region", region),), stats["rate_limited"]) for region, stats in api_stats["regions"].items()
+        ),
+    }
+    for counter in ("hits", "misses", "evictions", "expired"):
+        counters[f"memory_cache_{counter}"] = dict(
+            ((("kind", kind),), totals[counter]) for kind, totals in cache_stats["kinds"].items()
+        )
+    return Response(metrics.render_prometheus(gauges, counters), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/traces')
+def traces():
+    """Per-stage timings of this worker's most recent requests and jobs, newest first."""
+    # A non-integer limit falls back to the default; at most TRACE_HISTORY are kept anyway
+    limit = min(max(request.args.get('limit', 50, type=int), 1), TRACE_HISTORY)
+    return jsonify(metrics.recent_traces(limit))
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,79 @@
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import stats
+from batch_analyzer import ANALYSIS_INSERT_SQL, compute_rows
+from db import get_connection, transaction
+
+
+def _recompute_chunk(match_ids, all_participants):
+    """Worker process: analyze one chunk of matches from the feature tables. Only reads the database."""
+    return compute_rows(match_ids, all_participants)
+
+
+def run_backfill(run_name="default", workers=None, chunk_size=200, all_participants=False, restart=False):
+    """
+    Recompute analysis rows for every match in the feature tables on a process pool,
+    chunk_size matches per work unit. Only the parent writes; each chunk's rows and
+    the run's checkpoint are committed together, so an interrupted run resumes after
+    the last contiguous finished chunk; a completed run drops its checkpoint. Never
+    touches the network.
+    Returns {"matches", "rows", "seconds"}.
+    """
+    conn = get_connection()
+    if restart:
+        with transaction():
+            conn.execute("DELETE FROM backfill_checkpoints WHERE run_name = ?", (run_name,))
+    checkpoint = conn.execute(
+        "SELECT last_match_id, matches_done FROM backfill_checkpoints WHERE run_name = ?", (run_name,)
+    ).fetchone()
+    last_match_id, matches_done = checkpoint if checkpoint else ("", 0)
+
+    match_ids = [row[0] for row in conn.execute(
+        "SELECT match_id FROM match_info WHERE match_id > ? ORDER BY match_id", (last_match_id,)
+    )]
+    chunks = [match_ids[i:i + chunk_size] for i in range(0, len(match_ids), chunk_size)]
+    total = matches_done + len(match_ids)
+    if matches_done:
+        print(f"Resuming run '{run_name}' after {last_match_id} ({matches_done} matches already done)")
+
+    report = {"matches": 0, "rows": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    finished = set()
+    next_chunk = 0  # first chunk not yet covered by the checkpoint
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = dict((pool.submit(_recompute_chunk, chunk, all_participants), i) for i, chunk in enumerate(chunks))
+        for future in as_completed(futures):
+            i = futures[future]
+            rows = future.result()
+            finished.add(i)
+            report["matches"] += len(chunks[i])
+            report["rows"] += len(rows)
+
+            # Advance the checkpoint over the contiguous run of finished chunks
+            while next_chunk in finished:
+                matches_done += len(chunks[next_chunk])
+                last_match_id = chunks[next_chunk][-1]
+                next_chunk += 1
+            with transaction() as write_conn:
+                write_conn.executemany(ANALYSIS_INSERT_SQL, rows)
+                write_conn.execute(
+                    "REPLACE INTO backfill_checkpoints (run_name, last_match_id, matches_done, updated_at) "
+                    "VALUES (?, ?, ?, ?)", (run_name, last_match_id, matches_done, time.time())
+                )
+
+            elapsed = time.perf_counter() - start
+            rate = report["matches"] / elapsed if elapsed else 0
+            done = total - len(match_ids) + report["matches"]
+            sys.stdout.write(f"\r{done}/{total} matches, {report['rows']} rows, {rate:.0f} matches/s")
+            sys.stdout.flush()
+    if chunks:
+        print()
+
+    # Rows were written in bulk, so recompute the summary tables in one go
+    stats.rebuild_stats()
+    # Only an interrupted run resumes: the next one starts over (e.g. after a metric change)
+    with transaction():
+        conn.execute("DELETE FROM backfill_checkpoints WHERE run_name = ?", (run_name,))
+    report["seconds"] = time.perf_counter() - start
+    return report
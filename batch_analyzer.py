@@ -0,0 +1,195 @@
+import math
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import stats
+import features
+from cli import ANALYSIS_COLUMNS, QUEUE_MODES, analyze_match
+from db import get_connection, transaction
+
+MINIONS_TARGET_TIME = 600000  # 10 min in ms
+# Like cli.store_analysis_result(), a row stored for another puuid is never replaced
+ANALYSIS_INSERT_SQL = (
+    f"INSERT INTO analysis ({', '.join(ANALYSIS_COLUMNS + ['puuid', 'game_start_ts'])}) "
+    f"VALUES ({', '.join('?' * (len(ANALYSIS_COLUMNS) + 2))}) "
+    f"ON CONFLICT (summoner_name, match_id) DO UPDATE SET "
+    f"{', '.join(f'{c} = excluded.{c}' for c in ANALYSIS_COLUMNS[2:] + ['puuid', 'game_start_ts'])} "
+    f"WHERE analysis.puuid IS NULL OR analysis.puuid = excluded.puuid"
+)
+
+
+def iter_match_ids(chunk_size=500, match_ids=None):
+    """Yield sorted chunks of the IDs of matches with stored features (default: all of them)."""
+    if match_ids is not None:
+        match_ids = sorted(match_ids)
+        for i in range(0, len(match_ids), chunk_size):
+            yield match_ids[i:i + chunk_size]
+        return
+
+    conn = get_connection()
+    last_id = ""
+    while True:
+        chunk = [row[0] for row in conn.execute(
+            "SELECT match_id FROM match_info WHERE match_id > ? ORDER BY match_id LIMIT ?", (last_id, chunk_size)
+        )]
+        if not chunk:
+            return
+        last_id = chunk[-1]
+        yield chunk
+
+
+def load_features(match_ids, conn=None):
+    """
+    Columnar views of a chunk of matches, read straight from the feature tables:
+    participants (one row per participant), frames (one row per timeline frame),
+    participant_frames (minionsKilled per participant per frame) and
+    building_kills (one row per BUILDING_KILL event with a killer).
+    """
+    conn = conn or get_connection()
+    placeholders = ",".join("?" * len(match_ids))
+    participants = pd.read_sql_query(
+        f"SELECT p.match_id, p.puuid, p.participant_id, p.timeline_participant_id, p.team_id, p.kills, p.assists, "
+        f"p.champion, p.total_damage, p.time_ccing_others, p.scuttles, p.ability_uses, "
+        f"CASE WHEN p.tag_line != '' THEN p.name || '#' || p.tag_line ELSE p.name END AS name, m.game_start_ts, "
+        f"m.game_duration, m.queue_id, m.game_mode AS info_game_mode "
+        f"FROM match_participants p JOIN match_info m ON m.match_id = p.match_id "
+        f"WHERE p.match_id IN ({placeholders}) ORDER BY p.match_id, p.participant_id", conn, params=match_ids
+    )
+    participant_frames = pd.read_sql_query(
+        f"SELECT match_id, frame, timestamp, participant_id AS timeline_participant_id, minions_killed AS minions "
+        f"FROM participant_frames WHERE match_id IN ({placeholders})", conn, params=match_ids
+    )
+    frames = participant_frames[["match_id", "frame", "timestamp"]].drop_duplicates(["match_id", "frame"])
+    building_kills = pd.read_sql_query(
+        f"SELECT match_id, killer_id AS participant_id, timestamp FROM structure_kills "
+        f"WHERE match_id IN ({placeholders}) AND killer_id IS NOT NULL AND timestamp IS NOT NULL",
+        conn, params=match_ids
+    )
+    return participants, frames, participant_frames.drop(columns="timestamp"), building_kills
+
+
+def compute_metrics(participants, frames, participant_frames, building_kills):
+    """Every analyze_* metric for every participant row at once, as columns added to `participants`."""
+    df = participants
+
+    # Kill participation: (kills + assists) / team kills
+    team_kills = df.groupby(["match_id", "team_id"])["kills"].transform("sum").to_numpy()
+    involvement = (df["kills"] + df["assists"]).to_numpy(dtype=float)
+    df["kill_part"] = np.divide(involvement * 100, team_kills, out=np.zeros(len(df)), where=team_kills != 0)
+
+    # Minions @10: first frame at/after 10 min, else the last frame of the match
+    after = frames[frames["timestamp"] >= MINIONS_TARGET_TIME].groupby("match_id")["frame"].min()
+    last = frames.groupby("match_id")["frame"].max()
+    chosen = after.reindex(last.index).fillna(last).astype(np.int64).rename("frame").reset_index()
+    minions = participant_frames.merge(chosen, on=["match_id", "frame"])
+    df["minions_at_10"] = (
+        df[["match_id", "timeline_participant_id"]]
+        .merge(minions[["match_id", "timeline_participant_id", "minions"]],
+               on=["match_id", "timeline_participant_id"], how="left")["minions"]
+        .fillna(0).astype(np.int64).to_numpy()
+    )
+
+    # First structure: earliest BUILDING_KILL by any member of the team
+    killer_teams = df[["match_id", "participant_id", "team_id"]]
+    first = (building_kills.merge(killer_teams, on=["match_id", "participant_id"])
+             .groupby(["match_id", "team_id"])["timestamp"].min().rename("first_struct").reset_index())
+    df["first_struct"] = df[["match_id", "team_id"]].merge(first, on=["match_id", "team_id"], how="left")[
+        "first_struct"].to_numpy()
+
+    # Queue name, falling back to info.gameMode like get_game_mode()
+    df["game_mode"] = df["queue_id"].map(QUEUE_MODES).fillna(df["info_game_mode"])
+
+    # Local-time datetimes as in analyze_match(); one conversion per match, not per participant
+    starts = df["game_start_ts"].unique()
+    readable = dict((ts, datetime.fromtimestamp(ts / 1000).strftime("%Y-%m-%d %H:%M:%S")) for ts in starts)
+    df["game_datetime"] = df["game_start_ts"].map(readable)
+    return df
+
+
+def _analysis_rows(df):
+    """analysis-table tuples (ANALYSIS_COLUMNS + puuid, game_start_ts) for a computed frame."""
+    first_struct = df["first_struct"].fillna(0).to_numpy()
+    columns = [
+        df["summoner_name"], df["match_id"], df["game_datetime"], df["game_duration"], df["champion"],
+        df["game_mode"], df["minions_at_10"], df["kill_part"], first_struct, df["assists"], df["scuttles"],
+        df["ability_uses"], df["total_damage"], df["time_ccing_others"], df["puuid"], df["game_start_ts"],
+    ]
+    return list(zip(*(np.asarray(c).tolist() for c in columns)))
+
+
+def compute_rows(match_ids, all_participants=False, conn=None):
+    """
+    analysis-table tuples for a chunk of match IDs: the rows
+    already stored for these matches (with a known puuid), or with all_participants
+    also a row for every other participant, under their Riot ID.
+    """
+    conn = conn or get_connection()
+    df = compute_metrics(*load_features(match_ids, conn))
+    stored = pd.DataFrame(conn.execute(
+        f"SELECT summoner_name, match_id, puuid FROM analysis WHERE puuid IS NOT NULL "
+        f"AND match_id IN ({','.join('?' * len(match_ids))})", match_ids
+    ).fetchall(), columns=["summoner_name", "match_id", "puuid"])
+    if all_participants:
+        # Participants without a stored row get one under their Riot ID, like a whole-match pass
+        df = df.merge(stored, on=["match_id", "puuid"], how="left")
+        df["summoner_name"] = df["summoner_name"].fillna(df["name"])
+    else:
+        df = df.merge(stored, on=["match_id", "puuid"])
+    return _analysis_rows(df)
+
+
+def batch_analyze(all_participants=False, chunk_size=500, match_ids=None, check_parity=False):
+    """
+    Recompute analysis rows for every match in the feature tables with vectorized operations.
+    By default only rows already in 'analysis' (with a known puuid) are refreshed;
+    with all_participants every participant of every match gets a row.
+    Returns {"matches", "rows", "seconds", "mismatches"}; mismatches lists rows whose
+    values differ from the scalar analyze_match() (only with check_parity).
+    """
+    conn = get_connection()
+    report = {"matches": 0, "rows": 0, "seconds": 0.0, "mismatches": []}
+    start = time.perf_counter()
+
+    for chunk in iter_match_ids(chunk_size, match_ids):
+        rows = compute_rows(chunk, all_participants, conn)
+        with transaction() as write_conn:
+            write_conn.executemany(ANALYSIS_INSERT_SQL, rows)
+
+        if check_parity:
+            report["mismatches"].extend(_check_parity(features.load_matches(chunk, conn), rows))
+        report["matches"] += len(chunk)
+        report["rows"] += len(rows)
+
+    # Rows were written in bulk, so recompute the summary tables in one go
+    stats.rebuild_stats()
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def _check_parity(by_match, rows):
+    """Compare vectorized rows with the scalar analyze_match() of the same participant."""
+    mismatches = []
+    for row in rows:
+        values = dict(zip(ANALYSIS_COLUMNS + ["puuid", "game_start_ts"], row))
+        timeline, match_details = by_match[values["match_id"]]
+        expected = analyze_match(timeline, match_details, values["puuid"])
+        expected["first_struct"] = expected["first_struct"] or 0
+        pairs = {
+            "game_datetime": values["game_datetime"], "game_duration": values["game_duration"],
+            "champion": values["champion"], "game_mode": values["gameMode"],
+            "minions_at_10": values["minions_at_10"], "kill_part": values["kill_participation"],
+            "first_struct": values["first_structure_ts"], "assists": values["assists"],
+            "scuttles": values["scuttle_crabs"], "ability_uses": values["abilityUses"],
+            "total_damage": values["total_damage_dealt"], "time_ccing_others": values["time_ccing_others"],
+            "game_start_ts": values["game_start_ts"],
+        }
+        for key, got in pairs.items():
+            want = expected[key]
+            if isinstance(want, float) or isinstance(got, float):
+                same = math.isclose(float(got), float(want), rel_tol=1e-9, abs_tol=1e-9)
+            else:
+                same = got == want
+            if not same:
+                mismatches.append((values["match_id"], values["puuid"], key, got, want))
+    return mismatches
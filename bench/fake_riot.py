@@ -0,0 +1,215 @@
+"""
+Local stand-in for the Riot account-v1 and match-v5 endpoints used by cli.py, serving
+synthetic (bench/synthetic.py) or recorded payloads with configurable latency, rate
+limits (with Riot's X-*-Rate-Limit headers) and injected 429s.
+
+    python bench/fake_riot.py --port 8765 --latency-ms 50 --error-rate 0.02
+    RIOT_API_BASE=http://127.0.0.1:8765 python cli.py
+    RIOT_API_BASE='http://127.0.0.1:8765/{region}' python cli.py   # separate limits per cluster
+
+Recorded payloads: --recordings DIR serves DIR/<match_id>.json (match details) and
+DIR/<match_id>.timeline.json, and lists those match IDs (newest first) for every player.
+"""
+import argparse
+import collections
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+REGION_PREFIX = re.compile(r"^/(americas|asia|europe|sea)(/.*)$")
+ROUTES = [
+    ("account-region", re.compile(r"^/riot/account/v1/region/by-game/lol/by-puuid/([^/]+)$")),
+    ("account-by-riot-id", re.compile(r"^/riot/account/v1/accounts/by-riot-id/([^/]+)/([^/]+)$")),
+    ("match-ids", re.compile(r"^/lol/match/v5/matches/by-puuid/([^/]+)/ids$")),
+    ("match-timeline", re.compile(r"^/lol/match/v5/matches/([^/]+)/timeline$")),
+    ("match", re.compile(r"^/lol/match/v5/matches/([^/]+)$")),
+]
+
+
+class RateWindows:
+    """Sliding-window counters for a Riot rate limit spec ("20:1,100:120")."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.windows = []
+        for part in filter(None, (spec or "").split(",")):
+            limit, seconds = part.split(":")
+            self.windows.append((int(limit), int(seconds), collections.deque()))
+
+    def hit(self, now):
+        """Count a request; returns seconds to wait (> 0: refused) and the X-*-Count header value."""
+        retry_after = 0
+        for limit, seconds, stamps in self.windows:
+            while stamps and stamps[0] <= now - seconds:
+                stamps.popleft()
+            if len(stamps) >= limit:
+                retry_after = max(retry_after, stamps[0] + seconds - now)
+        if retry_after <= 0:
+            for _, _, stamps in self.windows:
+                stamps.append(now)
+        counts = ",".join(f"{len(stamps)}:{seconds}" for _, seconds, stamps in self.windows)
+        return retry_after, counts
+
+
+class FakeRiot:
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        # Like Riot, every cluster has its own app and method limits
+        self.app_limits = collections.defaultdict(lambda: RateWindows(args.app_limit))
+        self.method_limits = collections.defaultdict(lambda: RateWindows(args.method_limit))
+        self.random = random.Random(args.seed)
+        self.counters = collections.Counter()
+        self.recorded = None
+        if args.recordings:
+            names = os.listdir(args.recordings)
+            self.recorded = sorted((n[:-5] for n in names if n.endswith(".json") and not n.endswith(".timeline.json")),
+                                   reverse=True)
+
+    def _load(self, match_id, timeline):
+        if self.recorded is None:
+            return synthetic.make_match(match_id, self.args.frames)[0 if timeline else 1]
+        path = os.path.join(self.args.recordings, f"{match_id}.timeline.json" if timeline else f"{match_id}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def respond(self, method, groups, query):
+        """(status, payload) of one request, after the rate limits let it through."""
+        if method == "account-region":
+            return 200, {"puuid": groups[0], "game": "lol", "region": synthetic.PLATFORM.lower()}
+        if method == "account-by-riot-id":
+            game_name, tag_line = (urllib.parse.unquote(g) for g in groups)
+            puuid = synthetic.player_puuid(game_name)
+            if puuid is None:
+                return 404, {"status": {"status_code": 404, "message": "Data not found - No results found"}}
+            return 200, {"puuid": puuid, "gameName": game_name, "tagLine": tag_line}
+        if method == "match-ids":
+            start = int(query.get("start", 0))
+            count = int(query.get("count", 20))
+            if self.recorded is not None:
+                return 200, self.recorded[start:start + count]
+            start_time = int(query["startTime"]) if "startTime" in query else None
+            end_time = int(query["endTime"]) if "endTime" in query else None
+            return 200, synthetic.match_ids(count, start, self.args.history, start_time, end_time)
+        payload = self._load(groups[0], method == "match-timeline")
+        if payload is None:
+            return 404, {"status": {"status_code": 404, "message": "Data not found - match file not found"}}
+        return 200, payload
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeRiot/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/_stats":
+            return self._send(200, fake.stats())
+        query = dict(urllib.parse.parse_qsl(url.query))
+        region, path = "default", url.path
+        prefixed = REGION_PREFIX.match(path)
+        if prefixed:
+            region, path = prefixed.groups()
+        for method, pattern in ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return self._send(404, {"status": {"status_code": 404, "message": "Unknown endpoint"}})
+
+        args = fake.args
+        with fake.lock:
+            now = time.monotonic()
+            fake.counters["requests"] += 1
+            app_limits = fake.app_limits[region]
+            app_wait, app_counts = app_limits.hit(now)
+            method_limits = fake.method_limits[(region, method)]
+            method_wait, method_counts = method_limits.hit(now) if app_wait <= 0 else (0, "")
+            injected = fake.random.random() < args.error_rate
+            delay = max(0.0, fake.random.gauss(args.latency_ms, args.jitter_ms)) / 1000
+        headers = {
+            "X-App-Rate-Limit": app_limits.spec or "",
+            "X-App-Rate-Limit-Count": app_counts,
+            "X-Method-Rate-Limit": method_limits.spec or "",
+            "X-Method-Rate-Limit-Count": method_counts,
+        }
+        time.sleep(delay)
+
+        if app_wait > 0 or method_wait > 0 or injected:
+            with fake.lock:
+                fake.counters["rate_limited"] += 1
+            if app_wait > 0:
+                headers.update({"Retry-After": str(math.ceil(app_wait)), "X-Rate-Limit-Type": "application"})
+            elif method_wait > 0:
+                headers.update({"Retry-After": str(math.ceil(method_wait)), "X-Rate-Limit-Type": "method"})
+            else:
+                headers["Retry-After"] = "1"  # like a "service" 429: no limit type
+            return self._send(429, {"status": {"status_code": 429, "message": "Rate limit exceeded"}}, headers)
+
+        status, payload = fake.respond(method, match.groups(), query)
+        with fake.lock:
+            fake.counters[method] += 1
+        self._send(status, payload, headers)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Riot API endpoints used by cli.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50, help="mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--app-limit", default="20:1,100:120", help="app rate limit spec ('' for none)")
+    parser.add_argument("--method-limit", default="2000:10", help="rate limit spec of every endpoint ('' for none)")
+    parser.add_argument("--history", type=int, default=1000, help="games in the synthetic match history")
+    parser.add_argument("--frames", type=int, default=30, help="timeline frames per synthetic match")
+    parser.add_argument("--recordings", default=None, help="directory of recorded match JSON to serve instead")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def serve(args):
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    server.fake = FakeRiot(args)
+    return server
+
+
+if __name__ == "__main__":
+    args = make_parser().parse_args()
+    server = serve(args)
+    print(f"Fake Riot API on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,74 @@
+"""
+Check that concurrent processes sharing one riot_cache.db fetch every match exactly
+once: N worker processes load the same match IDs at the same time (with a fake,
+slow Riot API) and the number of API calls per match is counted.
+
+    python bench/inflight_check.py --workers 4 --matches 20
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import synthetic
+
+
+def _worker(ids, latency, calls, barrier):
+    import cli
+
+    def fake(kind):
+        def get(match_id):
+            with calls.get_lock():
+                calls.value += 1
+            time.sleep(latency)
+            return synthetic.make_match(match_id)[0 if kind == "timeline" else 1]
+        return get
+
+    cli.get_match_timeline = fake("timeline")
+    cli.get_match_details = fake("details")
+    barrier.wait()
+    results = cli.fetch_matches(ids)
+    errors = [mid for mid, _, _, error in results if error is not None]
+    if errors:
+        raise SystemExit(f"worker {os.getpid()} failed on {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--matches", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per fake API call")
+    args = parser.parse_args()
+
+    # A throwaway database in a temp directory (CACHE_DB is relative to the working directory)
+    os.chdir(tempfile.mkdtemp(prefix="inflight-check-"))
+    os.environ.setdefault("RIOT_APP_RATE_LIMIT", "100000:1")
+    import cli
+    cli.init_db()
+
+    ids = synthetic.match_ids(args.matches)
+    calls = multiprocessing.Value("i", 0)
+    barrier = multiprocessing.Barrier(args.workers)
+    start = time.perf_counter()
+    processes = [multiprocessing.Process(target=_worker, args=(ids, args.latency, calls, barrier))
+                 for _ in range(args.workers)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    expected = 2 * args.matches  # timeline + details
+    stored = cli.get_connection().execute("SELECT COUNT(*) FROM match_info").fetchone()[0]
+    print(f"{args.workers} workers, {args.matches} matches: {calls.value} API calls (expected {expected}), "
+          f"{stored} matches stored, {elapsed:.2f}s")
+    ok = calls.value == expected and stored == args.matches and all(p.exitcode == 0 for p in processes)
+    print("✅ every match fetched once" if ok else "❌ duplicate or missing fetches")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
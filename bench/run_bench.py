@@ -0,0 +1,186 @@
+"""
+Load-test the CLI and web flows against bench/fake_riot.py and report latency
+percentiles, throughput and peak RSS, cold (empty riot_cache.db) and warm.
+
+    python bench/run_bench.py --flows cli,app --matches 5,20 --concurrency 1,4
+
+cli: `concurrency` separate `cli.py` processes, each entering a Riot ID and a game count
+     at the interactive prompts. app: one Flask worker process with `concurrency` client
+     threads, each posting the form on '/', polling its job and reading the first table
+     page. Every scenario runs in a fresh directory; 'warm' repeats it there in new
+     processes. Throughput includes process start-up; peak RSS is the largest of the
+     scenario's processes.
+"""
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, BENCH_DIR)
+import synthetic
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * q
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def _cli_process(worker, matches, iterations, queue):
+    import cli
+    game_name = synthetic.PLAYERS[worker % len(synthetic.PLAYERS)]
+
+    def answer(prompt=""):
+        if "summoner number" in prompt:
+            # Enter the Riot ID; read its number off the menu printed so far, as other
+            # simulated users may grow the shared roster meanwhile
+            return re.findall(r" (\d+): Enter summoner by Riot ID", sys.stdout.getvalue())[-1]
+        if "gameName" in prompt:
+            return game_name
+        if "tagLine" in prompt:
+            return synthetic.PLATFORM
+        return str(matches)
+
+    builtins.input = answer
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            cli.main([])
+        latencies.append(time.perf_counter() - start)
+    queue.put((latencies, _peak_rss_mb()))
+
+
+def _app_process(concurrency, matches, iterations, queue):
+    import app as web
+
+    def client_thread(worker, latencies):
+        client = web.app.test_client()
+        game_name = synthetic.PLAYERS[worker % len(synthetic.PLAYERS)]
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = client.post("/", data={
+                "manual_mode": "on", "game_name": game_name, "tag_line": synthetic.PLATFORM, "count": matches,
+            })
+            job_id = response.headers["Location"].split("job=")[1]
+            client.get(f"/?job={job_id}")
+            while client.get(f"/jobs/{job_id}").get_json()["status"] not in ("done", "failed"):
+                time.sleep(0.01)
+            data_url = client.get(f"/jobs/{job_id}/result").get_json()["data_url"]
+            client.get(f"{data_url}&draw=1&start=0&length=25")
+            latencies.append(time.perf_counter() - start)
+
+    per_thread = [[] for _ in range(concurrency)]
+    threads = [threading.Thread(target=client_thread, args=(i, per_thread[i])) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    queue.put(([x for latencies in per_thread for x in latencies], _peak_rss_mb()))
+
+
+def run_phase(flow, matches, concurrency, iterations):
+    """Run one cold or warm pass in the current directory; returns its report row."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    if flow == "cli":
+        processes = [ctx.Process(target=_cli_process, args=(i, matches, iterations, queue)) for i in range(concurrency)]
+    else:
+        processes = [ctx.Process(target=_app_process, args=(concurrency, matches, iterations, queue))]
+    start = time.perf_counter()
+    for p in processes:
+        p.start()
+    outputs = [queue.get() for _ in processes]
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - start
+    latencies = [x for lat, _ in outputs for x in lat]
+    return {
+        "flow": flow, "matches": matches, "concurrency": concurrency, "runs": len(latencies),
+        "p50": _percentile(latencies, 0.5), "p95": _percentile(latencies, 0.95),
+        "matches_per_s": len(latencies) * matches / elapsed if elapsed else 0.0,
+        "peak_rss_mb": max(rss for _, rss in outputs),
+    }
+
+
+def _wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.05)
+    raise RuntimeError(f"fake Riot API did not start on port {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CLI and web flows against a fake Riot API.")
+    parser.add_argument("--flows", default="cli,app")
+    parser.add_argument("--matches", default="5,20", help="games per analysis, comma-separated")
+    parser.add_argument("--concurrency", default="1,4", help="concurrent users, comma-separated")
+    parser.add_argument("--iterations", type=int, default=1, help="analyses per user and pass")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--app-limit", default="", help="rate limit of the fake API ('' for none)")
+    parser.add_argument("--output", default=None, help="also write the report rows to this JSON file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    server = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_riot.py"), "--port", str(args.port),
+        "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate), "--app-limit", args.app_limit,
+    ], stdout=subprocess.DEVNULL)
+    os.environ.update({
+        "RIOT_API_BASE": f"http://127.0.0.1:{args.port}",
+        "RIOT_API_KEY": os.environ.get("RIOT_API_KEY", "bench"),
+        "RIOT_APP_RATE_LIMIT": os.environ.get("RIOT_APP_RATE_LIMIT", "100000:1"),
+    })
+    rows = []
+    try:
+        _wait_for_port(args.port)
+        print(f"{'flow':<5} {'games':>5} {'users':>5} {'cache':<5} {'runs':>4} {'p50 s':>7} {'p95 s':>7} "
+              f"{'games/s':>8} {'RSS MB':>7}")
+        for flow in args.flows.split(","):
+            for matches in (int(n) for n in args.matches.split(",")):
+                for concurrency in (int(n) for n in args.concurrency.split(",")):
+                    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+                        os.chdir(workdir)
+                        for cache in ("cold", "warm"):
+                            row = dict(run_phase(flow, matches, concurrency, args.iterations), cache=cache)
+                            rows.append(row)
+                            print(f"{flow:<5} {matches:>5} {concurrency:>5} {cache:<5} {row['runs']:>4} "
+                                  f"{row['p50']:>7.3f} {row['p95']:>7.3f} {row['matches_per_s']:>8.1f} "
+                                  f"{row['peak_rss_mb']:>7.1f}", flush=True)
+                        os.chdir(BENCH_DIR)
+    finally:
+        server.terminate()
+        server.wait()
+    if output:
+        with open(output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
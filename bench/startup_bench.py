@@ -0,0 +1,86 @@
+"""
+Time the start-up of the CLI and web entry points, each in fresh interpreter
+processes against an already initialized riot_cache.db, and check which heavy
+modules they load. Paths that produce no table must not import pandas / numpy.
+
+    python bench/startup_bench.py --runs 5 --max-ms 400
+
+Reports the median and worst time from the first line of the process to the end
+of the scenario (interpreter start-up excluded) and the process wall time. Exits
+with status 1 if a light scenario loads a heavy module or exceeds --max-ms.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY = ["pandas", "numpy"]
+# name: (code run in the fresh process, whether heavy modules are allowed)
+SCENARIOS = {
+    "import cli": ("import cli", False),
+    "import app": ("import app", False),
+    "cli compact": ("import cli; cli.main(['compact'])", False),
+    "GET /": ("import app; app.app.test_client().get('/')", False),
+    "GET /api/series": ("import app; app.app.test_client().get('/api/series/EUW1_1')", False),
+    "GET /api/analysis": (
+        "import app; app.app.test_client().get('/api/analysis?summoner=Player0&draw=1&start=0&length=25')", True
+    ),
+}
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+{code}
+print(json.dumps({{"seconds": time.perf_counter() - start, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def run_once(code):
+    """(in-process seconds, heavy modules loaded, process wall seconds) of one fresh process."""
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(root=ROOT, code=code, heavy=HEAVY)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    wall = time.perf_counter() - start
+    report = json.loads(output.strip().splitlines()[-1])
+    return report["seconds"], report["heavy"], wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the start-up time of cli.py and app.py.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per scenario")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if a light scenario's median exceeds this")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="startup-") as workdir:
+        os.chdir(workdir)
+        # Start from an initialized schema, as a deployed instance would
+        run_once("import cli; cli.init_db()")
+        print(f"{'scenario':<18} {'median ms':>9} {'max ms':>7} {'wall ms':>7}  heavy modules")
+        for name, (code, heavy_allowed) in SCENARIOS.items():
+            runs = [run_once(code) for _ in range(args.runs)]
+            seconds = [s for s, _, _ in runs]
+            heavy = sorted(set(m for _, modules, _ in runs for m in modules))
+            median_ms = statistics.median(seconds) * 1000
+            print(f"{name:<18} {median_ms:>9.0f} {max(seconds) * 1000:>7.0f} "
+                  f"{statistics.median(w for _, _, w in runs) * 1000:>7.0f}  {', '.join(heavy) or '-'}", flush=True)
+            if not heavy_allowed:
+                if heavy:
+                    print(f"❌ {name} imports {', '.join(heavy)}")
+                    failed = True
+                if args.max_ms is not None and median_ms > args.max_ms:
+                    print(f"❌ {name} takes {median_ms:.0f} ms (budget {args.max_ms:.0f} ms)")
+                    failed = True
+        os.chdir(ROOT)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import random
+
+PLATFORM = "EUW1"
+FIRST_MATCH = 7000000000
+FIRST_GAME_START = 1700000000000  # ms; match k of the history starts k hours later
+PLAYERS = [f"Player{i}" for i in range(10)]
+
+
+def player_puuid(game_name):
+    """puuid of one of the ten synthetic players (who play every match together), or None."""
+    return f"bench-{game_name.lower()}" if game_name in PLAYERS else None
+
+
+def game_start(match_id):
+    return FIRST_GAME_START + (int(match_id.split("_")[1]) - FIRST_MATCH) * 3600000
+
+
+def match_ids(count, start=0, history=1000, start_time=None, end_time=None):
+    """
+    IDs of the synthetic match history (`history` games), newest first like match-v5:
+    `count` IDs from index `start`, optionally limited to games started in
+    [start_time, end_time] (epoch seconds).
+    """
+    ids = []
+    for k in range(history - 1, -1, -1):
+        match_id = f"{PLATFORM}_{FIRST_MATCH + k}"
+        started = game_start(match_id) // 1000
+        if (start_time is None or started >= start_time) and (end_time is None or started <= end_time):
+            ids.append(match_id)
+    return ids[start:start + count]
+
+
+def make_match(match_id, frames=30):
+    """Deterministic Riot-shaped (timeline, match_details) for a synthetic match ID."""
+    r = random.Random(match_id)
+    puuids = [player_puuid(name) for name in PLAYERS]
+    participants = []
+    for i, puuid in enumerate(puuids):
+        participants.append({
+            "puuid": puuid, "participantId": i + 1, "teamId": 100 if i < 5 else 200,
+            "riotIdGameName": PLAYERS[i], "riotIdTagline": PLATFORM, "championName": f"Champion{r.randint(1, 160)}",
+            "kills": r.randint(0, 12), "assists": r.randint(0, 15),
+            "totalDamageDealtToChampions": r.randint(3000, 45000), "timeCCingOthers": r.randint(0, 60),
+            "challenges": {"scuttleCrabKills": r.randint(0, 3), "abilityUses": r.randint(50, 500)},
+        })
+    match_details = {
+        "metadata": {"matchId": match_id, "participants": puuids},
+        "info": {
+            "gameStartTimestamp": game_start(match_id), "gameDuration": r.randint(900, 2400),
+            "queueId": r.choice([400, 420, 440, 450]), "gameMode": "CLASSIC", "participants": participants,
+        },
+    }
+
+    timeline_frames = []
+    for minute in range(frames):
+        participant_frames = dict((str(i + 1), {
+            "participantId": i + 1, "minionsKilled": minute * 7 + r.randint(0, 3),
+            "jungleMinionsKilled": minute, "totalGold": 500 + minute * 400 + r.randint(0, 200),
+            "xp": minute * 300, "level": 1 + minute // 3,
+            "position": {"x": r.randint(0, 14800), "y": r.randint(0, 14800)},
+        }) for i in range(10))
+        events = [{"type": "CHAMPION_KILL", "killerId": r.randint(1, 10), "timestamp": minute * 60000 + 5}]
+        if minute in (12, 15, 20):
+            events.append({"type": "BUILDING_KILL", "killerId": r.randint(0, 10), "teamId": r.choice([100, 200]),
+                           "buildingType": "TOWER_BUILDING", "laneType": "MID_LANE", "towerType": "OUTER_TURRET",
+                           "timestamp": minute * 60000 + r.randint(0, 59999)})
+        timeline_frames.append({"timestamp": minute * 60000 + r.randint(0, 100),
+                                "participantFrames": participant_frames, "events": events})
+    timeline = {"metadata": {"matchId": match_id, "participants": puuids}, "info": {"frames": timeline_frames}}
+    return timeline, match_details
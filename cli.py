@@ -1,19 +1,54 @@
 import requests
 import urllib.parse
-import pandas as pd
-import sqlite3
-import json
+import argparse
 import os
-from config import API_KEY, REGION, CACHE_DB, load_custom_summoners, save_custom_summoner
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import (
+    REGION, FETCH_WORKERS, CACHE_CODEC, CACHE_RAW_MATCHES, ANALYZE_WHOLE_MATCH, FETCH_LOCK_STALE_SECONDS,
+    RAW_RETENTION_DAYS, RAW_CACHE_MAX_MB, LOOKUP_NOT_FOUND_TTL, LOOKUP_MATCH_NOT_FOUND_TTL
+)
+from riot_client import riot_get, get_scheduler_stats, api_base, region_for_match, region_for_platform
+from memory_cache import cache as memory_cache, get_cache_stats
+import stats
+import features
+import roster
+import series
+import lookups
+import inflight
+import metrics
+from features import get_participant_riot_id
+from timeline_engine import run_extractors, MinionsAt10, FirstStructure
+from db import (
+    get_connection, transaction, add_missing_column, migrate_schema, pending_backfills, run_backfills, compact,
+    chunked, get_codec_id, encode_blob, decode_blob, migrate_cache_codec
+)
 from datetime import datetime
 
 def get_summoner_by_riot_id(game_name, tag_line):
+    cache_key = lookups.riot_id_key(game_name, tag_line)
+    cached = memory_cache.get("account", cache_key)
+    if cached:
+        return cached
+    return lookups.coalesce(("account", cache_key), lambda: _lookup_riot_id(game_name, tag_line, cache_key))
+
+def _lookup_riot_id(game_name, tag_line, cache_key):
+    """get_summoner_by_riot_id() past the memory cache: known Riot IDs and recent 404s first, then account-v1."""
+    data = lookups.get_account(cache_key)
+    if data:
+        memory_cache.set("account", cache_key, data)
+        return data
+    if lookups.known_failures("account", [cache_key]):
+        print(f"❌ Riot ID {game_name}#{tag_line} was not found (checked recently)")
+        return None
+
     encoded_game_name = urllib.parse.quote(game_name)
     encoded_tag_line = urllib.parse.quote(tag_line)
-    url = f"https://{REGION}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{encoded_game_name}/{encoded_tag_line}"
-    headers = {"X-Riot-Token": API_KEY}
+    # account-v1 answers for every player on any cluster
+    url = f"{api_base()}/riot/account/v1/accounts/by-riot-id/{encoded_game_name}/{encoded_tag_line}"
 
-    response = requests.get(url, headers=headers)
+    response = riot_get("account-by-riot-id", url)
 
     try:
         response.raise_for_status()
@@ -24,29 +59,37 @@ def get_summoner_by_riot_id(game_name, tag_line):
             print("❌ Unexpected API response structure:", data)
             return None
 
+        lookups.save_accounts([(data["gameName"], data["tagLine"], data["puuid"])])
+        memory_cache.set("account", cache_key, data)
         return data
     except requests.exceptions.HTTPError as err:
+        if lookups.is_not_found(err):
+            lookups.save_failures("account", [cache_key], ttl=LOOKUP_NOT_FOUND_TTL)
         print(f"❌ Riot API error: {err} - {response.text}")
         return None
 
-def init_db():
-    """Initialize the SQLite database and create tables if they do not exist."""
-    conn = sqlite3.connect(CACHE_DB)
+def _schema_v1(conn):
+    """Every table as of the first versioned schema; also upgrades databases created before versioning."""
     c = conn.cursor()
 
-    # Table for raw caching (optional)
+    # Table for raw caching (optional); `format` is the storage codec id of `data`
     c.execute('''
         CREATE TABLE IF NOT EXISTS timeline (
             match_id TEXT PRIMARY KEY,
-            data TEXT
+            data TEXT,
+            format INTEGER NOT NULL DEFAULT 0
         )
     ''')
     c.execute('''
         CREATE TABLE IF NOT EXISTS match_details (
             match_id TEXT PRIMARY KEY,
-            data TEXT
+            data TEXT,
+            format INTEGER NOT NULL DEFAULT 0
         )
     ''')
+    # Caches created before codecs existed hold plain JSON text (format 0)
+    add_missing_column(conn, "timeline", "format", "INTEGER NOT NULL DEFAULT 0")
+    add_missing_column(conn, "match_details", "format", "INTEGER NOT NULL DEFAULT 0")
 
     # Table for final analysis results (added game_duration for total game time)
     c.execute('''
@@ -65,59 +108,427 @@ def init_db():
             abilityUses INTEGER,
             total_damage_dealt INTEGER,
             time_ccing_others INTEGER,
+            puuid TEXT,
+            game_start_ts INTEGER,
             PRIMARY KEY (summoner_name, match_id)
         )
     ''')
-    conn.commit()
-    conn.close()
+    add_missing_column(conn, "analysis", "puuid", "TEXT")
+    add_missing_column(conn, "analysis", "game_start_ts", "INTEGER")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_analysis_puuid ON analysis (puuid, match_id)")
+
+    # Per-player match-list sync watermark: the contiguous range of recent games
+    # already stored (gameStartTimestamp in ms) and how many games it holds
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            puuid TEXT PRIMARY KEY,
+            newest_game_start INTEGER,
+            oldest_game_start INTEGER,
+            match_count INTEGER
+        )
+    ''')
+
+    # Background analysis jobs of the web app (see jobs.py); job_key identifies
+    # identical requests so in-flight duplicates can be merged
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            job_key TEXT,
+            status TEXT,
+            summoner_name TEXT,
+            puuid TEXT,
+            count INTEGER,
+            completed INTEGER,
+            total INTEGER,
+            result TEXT,
+            error TEXT,
+            created_at REAL,
+            updated_at REAL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (job_key, status)")
+
+    # Resume points of 'backfill' runs (see backfill.py): the last match ID of the
+    # contiguous prefix of the raw cache already recomputed
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            run_name TEXT PRIMARY KEY,
+            last_match_id TEXT,
+            matches_done INTEGER,
+            updated_at REAL
+        )
+    ''')
+
+    # Tracked summoners (see roster.py)
+    roster.create_tables(conn)
+
+    # Cross-process locks of matches being fetched (see inflight.py)
+    inflight.create_tables(conn)
+
+    # Compact per-match features read by the analyzers (see features.py)
+    features_created = features.create_tables(conn)
+    backfill_features = features_created and conn.execute("SELECT 1 FROM timeline LIMIT 1").fetchone()
+
+    # Per-summoner / champion / mode aggregates (see stats.py)
+    stats_created = stats.create_tables(conn)
+    backfill_stats = stats_created and conn.execute("SELECT 1 FROM analysis LIMIT 1").fetchone()
+
+    backfills = []
+    if backfill_features:
+        backfills.append("extract_features")
+    if backfill_stats:
+        backfills.append("rebuild_stats")
+    # Rows stored before puuids were recorded (see fill_analysis_puuids)
+    if conn.execute("SELECT 1 FROM analysis WHERE puuid IS NULL LIMIT 1").fetchone():
+        backfills.append("fill_analysis_puuids")
+    return backfills
+
+def _schema_v2(conn):
+    """
+    Integer game start times (ms) on every analysis row, which sorting and rolling
+    windows now use instead of the game_datetime label, and indexes for listings
+    and per-champion / per-mode queries.
+    """
+    conn.execute('''
+        UPDATE analysis SET game_start_ts = (
+            SELECT game_start_ts FROM match_info WHERE match_info.match_id = analysis.match_id
+        ) WHERE game_start_ts IS NULL
+    ''')
+    # game_datetime was written in local time
+    conn.execute(
+        "UPDATE analysis SET game_start_ts = CAST(strftime('%s', game_datetime, 'utc') AS INTEGER) * 1000 "
+        "WHERE game_start_ts IS NULL AND game_datetime IS NOT NULL"
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_analysis_summoner_datetime")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_summoner_start ON analysis (summoner_name, game_start_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_champion ON analysis (champion)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_mode ON analysis (gameMode)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_match_info_start ON match_info (game_start_ts)")
+
+def _schema_v3(conn):
+    """Per-minute chart series (see series.py), derived from the stored participant frames."""
+    if series.create_tables(conn) and conn.execute("SELECT 1 FROM participant_frames LIMIT 1").fetchone():
+        return ["rebuild_series"]
+
+def _schema_v4(conn):
+    """Riot ID -> puuid mappings and remembered 404s (see lookups.py)."""
+    lookups.create_tables(conn)
+
+def fill_analysis_puuids():
+    """
+    Set the puuid of analysis rows stored without one: the participant of the match with
+    the row's name, else the roster player of that name if they played in it.
+    """
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE analysis SET puuid = (
+                SELECT p.puuid FROM match_participants p
+                WHERE p.match_id = analysis.match_id AND p.name = analysis.summoner_name COLLATE NOCASE
+            ) WHERE puuid IS NULL
+        ''')
+        conn.execute('''
+            UPDATE analysis SET puuid = (
+                SELECT r.puuid FROM roster r
+                JOIN match_participants p ON p.match_id = analysis.match_id AND p.puuid = r.puuid
+                WHERE r.name = analysis.summoner_name
+            ) WHERE puuid IS NULL
+        ''')
+
+# Schema history, applied in order by db.migrate_schema(); PRAGMA user_version counts the
+# ones already applied. Never edit a released migration: append a new one.
+SCHEMA_MIGRATIONS = [_schema_v1, _schema_v2, _schema_v3, _schema_v4]
+# Data backfills a migration can ask for, by name, in the order they run (features
+# first: the others read them). Each must be safe to run again after an interruption.
+SCHEMA_BACKFILLS = {
+    "extract_features": features.extract_from_raw,
+    "fill_analysis_puuids": fill_analysis_puuids,
+    "rebuild_series": series.rebuild_series,
+    "rebuild_stats": stats.rebuild_stats,
+}
+
+_schema_ready = False
+
+def init_db(with_backfills=False):
+    """
+    Create or upgrade the SQLite schema; only the first call in a process does any work.
+    The data backfills of an upgrade can take minutes, so only the CLI runs them
+    (with_backfills); the web app just warns until they are done.
+    """
+    global _schema_ready
+    if _schema_ready and not with_backfills:
+        return
+    if not _schema_ready:
+        migrate_schema(SCHEMA_MIGRATIONS)
+        _schema_ready = True
+    pending = pending_backfills()
+    if pending and with_backfills:
+        print(f"⏳ Finishing the schema upgrade: {', '.join(pending)}...")
+        run_backfills(SCHEMA_BACKFILLS)
+    elif pending:
+        print(f"⚠️ Schema upgrade not finished ({', '.join(pending)} pending): run 'python cli.py upgrade'")
+
+# Columns of an 'analysis' row as shown to users (puuid is only used for lookups)
+ANALYSIS_COLUMNS = [
+    "summoner_name", "match_id", "game_datetime", "game_duration", "champion", "gameMode",
+    "minions_at_10", "kill_participation", "first_structure_ts", "assists", "scuttle_crabs",
+    "abilityUses", "total_damage_dealt", "time_ccing_others",
+]
+# store_analysis_result() keyword arguments for ANALYSIS_COLUMNS[2:] + puuid, game_start_ts
+STORE_ARGUMENTS = [
+    "game_datetime", "game_duration", "champion", "game_mode", "minions_at_10", "kill_part",
+    "first_struct", "assists", "scuttles", "ability_uses", "total_damage", "time_ccing_others",
+    "puuid", "game_start_ts",
+]
+# Text columns matched by the global search of the paginated analysis table
+SEARCHABLE_COLUMNS = ["match_id", "game_datetime", "champion", "gameMode"]
+# Sort keys of displayed columns that are labels of an integer column
+SORT_COLUMNS = {"game_datetime": "game_start_ts"}
 
 def cache_get(table, match_id):
-    conn = sqlite3.connect(CACHE_DB)
-    c = conn.cursor()
-    c.execute(f"SELECT data FROM {table} WHERE match_id = ?", (match_id,))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        return json.loads(row[0])
+    with metrics.stage("decode"):
+        row = get_connection().execute(f"SELECT data, format FROM {table} WHERE match_id = ?", (match_id,)).fetchone()
+        if row:
+            return decode_blob(row[0], row[1])
     return None
 
 def cache_set(table, match_id, data):
-    conn = sqlite3.connect(CACHE_DB)
-    c = conn.cursor()
-    c.execute(f"REPLACE INTO {table} (match_id, data) VALUES (?, ?)",
-              (match_id, json.dumps(data)))
-    conn.commit()
-    conn.close()
+    codec_id = get_codec_id()
+    with transaction() as conn:
+        conn.execute(f"REPLACE INTO {table} (match_id, data, format) VALUES (?, ?, ?)",
+                     (match_id, encode_blob(data, codec_id), codec_id))
 
 def get_match_timeline(match_id):
-    url = f'https://{REGION}.api.riotgames.com/lol/match/v5/matches/{match_id}/timeline'
-    headers = {'X-Riot-Token': API_KEY}
-    response = requests.get(url, headers=headers)
+    region = region_for_match(match_id)
+    url = f'{api_base(region)}/lol/match/v5/matches/{match_id}/timeline'
+    response = riot_get("match-timeline", url, region=region)
     response.raise_for_status()
     return response.json()
 
 def get_match_details(match_id):
-    url = f'https://{REGION}.api.riotgames.com/lol/match/v5/matches/{match_id}'
-    headers = {'X-Riot-Token': API_KEY}
-    response = requests.get(url, headers=headers)
+    region = region_for_match(match_id)
+    url = f'{api_base(region)}/lol/match/v5/matches/{match_id}'
+    response = riot_get("match", url, region=region)
     response.raise_for_status()
     return response.json()
 
-def get_match_timeline_cached(match_id):
-    cached = cache_get("timeline", match_id)
+def get_player_region(puuid):
+    """
+    Cluster holding a player's match history: from the newest match stored for them,
+    else from the platform account-v1 reports for their League account (REGION if it
+    has none: 404). Other API errors are raised, not remembered.
+    """
+    cached = memory_cache.get("account-region", puuid)
     if cached:
         return cached
-    data = get_match_timeline(match_id)
-    cache_set("timeline", match_id, data)
-    return data
+    return lookups.coalesce(("account-region", puuid), lambda: _lookup_player_region(puuid))
 
-def get_match_details_cached(match_id):
-    cached = cache_get("match_details", match_id)
-    if cached:
-        return cached
-    data = get_match_details(match_id)
-    cache_set("match_details", match_id, data)
-    return data
+def _lookup_player_region(puuid):
+    region = lookups.get_region(puuid)
+    if region:
+        memory_cache.set("account-region", puuid, region)
+        return region
+    row = get_connection().execute(
+        "SELECT match_id FROM analysis WHERE puuid = ? ORDER BY game_start_ts DESC LIMIT 1", (puuid,)
+    ).fetchone()
+    if row:
+        region = region_for_match(row[0])
+    else:
+        url = f"{api_base()}/riot/account/v1/region/by-game/lol/by-puuid/{puuid}"
+        response = riot_get("account-region", url)
+        if response.status_code == 404:
+            region = REGION
+        else:
+            response.raise_for_status()
+            region = region_for_platform(response.json().get("region"))
+            lookups.save_region(puuid, region)
+    memory_cache.set("account-region", puuid, region)
+    return region
+
+def get_match_ids(puuid, count, start=0, start_time=None, end_time=None):
+    """
+    Match IDs for a player, newest first: `count` (max 100) IDs from index `start`,
+    optionally limited to games started in [start_time, end_time] (epoch seconds).
+    """
+    cache_key = (puuid, count, start, start_time, end_time)
+    cached = memory_cache.get("match-ids", cache_key)
+    if cached is not None:
+        return list(cached)
+    # Identical concurrent requests (e.g. two jobs for the same player) share one API call
+    return list(lookups.coalesce(("match-ids", cache_key), lambda: _lookup_match_ids(cache_key)))
+
+def _lookup_match_ids(cache_key):
+    puuid, count, start, start_time, end_time = cache_key
+    region = get_player_region(puuid)
+    url = f'{api_base(region)}/lol/match/v5/matches/by-puuid/{puuid}/ids'
+    params = {"start": start, "count": count}
+    if start_time is not None:
+        params["startTime"] = start_time
+    if end_time is not None:
+        params["endTime"] = end_time
+    response = riot_get("match-ids", url, params=params, region=region)
+    response.raise_for_status()
+    match_ids = tuple(response.json())
+    memory_cache.set("match-ids", cache_key, match_ids)
+    return match_ids
+
+def get_all_match_ids(puuid, limit, start_time=None, end_time=None, page_size=100):
+    """Page through get_match_ids() until `limit` IDs are collected or the history ends."""
+    match_ids = []
+    while len(match_ids) < limit:
+        count = min(page_size, limit - len(match_ids))
+        page = get_match_ids(puuid, count, start=len(match_ids), start_time=start_time, end_time=end_time)
+        match_ids.extend(page)
+        if len(page) < count:
+            break
+    return match_ids
+
+def _fetch_missing(match_id, timeline, match_details):
+    """Fetch whichever of timeline / match_details is not cached yet (runs on a worker thread)."""
+    if not timeline:
+        timeline = get_match_timeline(match_id)
+    if not match_details:
+        match_details = get_match_details(match_id)
+    return timeline, match_details
+
+def _fetch_claimed(missing, owner, max_workers, results, fetched, on_done=None):
+    """
+    Fetch the matches locked by `owner` into `results` and `fetched`, on one thread
+    pool per cluster: workers waiting on a throttled region never hold up another.
+    """
+    by_region = {}
+    for m in missing:
+        by_region.setdefault(region_for_match(m[0]), []).append(m)
+    pools = []
+    futures = {}
+    last_heartbeat = time.monotonic()
+    try:
+        for region, region_missing in by_region.items():
+            pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(region_missing))),
+                                      thread_name_prefix=f"fetch-{region}")
+            pools.append(pool)
+            for mid, timeline, match_details in region_missing:
+                # Run in a copy of the caller's context, so HTTP timings land in its trace
+                future = pool.submit(contextvars.copy_context().run, _fetch_missing, mid, timeline, match_details)
+                futures[future] = (mid, timeline, match_details)
+        for future in as_completed(futures):
+            mid, cached_timeline, cached_details = futures[future]
+            try:
+                timeline, match_details = future.result()
+            except Exception as e:
+                results[mid] = (mid, None, None, e)
+            else:
+                fetched.append((mid, timeline, match_details, bool(cached_timeline), bool(cached_details)))
+                results[mid] = (mid, timeline, match_details, None)
+            if on_done:
+                on_done()
+            if time.monotonic() - last_heartbeat > FETCH_LOCK_STALE_SECONDS / 3:
+                inflight.heartbeat(owner)
+                last_heartbeat = time.monotonic()
+    finally:
+        for pool in pools:
+            pool.shutdown()
+
+def _store_fetched(fetched, owner, results, not_found=()):
+    """
+    Write feature rows (and raw JSON) of newly loaded matches, remember the matches
+    Riot no longer has, and drop `owner`'s locks, in one transaction. A match whose
+    payload cannot be read gets its exception in `results` and nothing is written for it.
+    """
+    with metrics.stage("store_features"), transaction() as conn:
+        lookups.save_failures("match", not_found, ttl=LOOKUP_MATCH_NOT_FOUND_TTL)
+        for mid, timeline, match_details, cached_timeline, cached_details in fetched:
+            try:
+                extracted = features.extract_features(mid, timeline, match_details)
+            except Exception as e:
+                results[mid] = (mid, None, None, e)
+                continue
+            features.write_features(conn, mid, extracted)
+            lookups.save_match_accounts(match_details, region_for_match(mid))
+            if CACHE_RAW_MATCHES and not cached_timeline:
+                cache_set("timeline", mid, timeline)
+            if CACHE_RAW_MATCHES and not cached_details:
+                cache_set("match_details", mid, match_details)
+        inflight.release(owner)
+
+def fetch_matches(match_ids, max_workers=FETCH_WORKERS, progress=None):
+    """
+    Load timeline and details for every match, fetching the unknown ones from
+    the Riot API in parallel on a bounded thread pool.
+
+    Returns a list of (match_id, timeline, match_details, error) tuples in the same
+    order as match_ids. A failing match gets its exception in `error` instead of
+    aborting the whole batch. Known matches are rebuilt from the feature tables
+    (features.load_matches), falling back to the raw cache. Database reads and writes
+    stay on the calling thread. Matches being fetched by another process are waited
+    for instead of fetched twice.
+    `progress(done, total)` is called as matches become available. Matches read from
+    the feature tables are kept in the in-process memory cache, which is checked first.
+    """
+    results = {}
+    for mid in match_ids:
+        cached = memory_cache.get("match", mid)
+        if cached:
+            results[mid] = (mid, *cached, None)
+    with metrics.stage("load_features"):
+        loaded = features.load_matches([mid for mid in match_ids if mid not in results])
+    for mid, (timeline, match_details) in loaded.items():
+        memory_cache.set("match", mid, (timeline, match_details))
+        results[mid] = (mid, timeline, match_details, None)
+    missing = []
+    fetched = []
+    for mid in match_ids:
+        if mid in results:
+            continue
+        timeline = cache_get("timeline", mid)
+        match_details = cache_get("match_details", mid)
+        if timeline and match_details:
+            # Cached before the feature tables existed
+            fetched.append((mid, timeline, match_details, True, True))
+            results[mid] = (mid, timeline, match_details, None)
+        else:
+            missing.append((mid, timeline, match_details))
+    if progress:
+        progress(len(results), len(match_ids))
+
+    # Every missing match is fetched by one process only: the others wait for its
+    # feature rows (see inflight.py), and retry themselves if that fetch failed
+    owner = inflight.new_owner()
+    on_done = None
+    if progress:
+        on_done = lambda: progress(len(results), len(match_ids))
+    try:
+        while missing:
+            # Matches Riot answered 404 for recently (deleted, remakes without a timeline, or
+            # not published yet) are not asked again
+            gone = lookups.known_failures("match", [mid for mid, _, _ in missing])
+            for mid in gone:
+                results[mid] = (mid, None, None, lookups.NotFoundError(f"Match {mid} was not found (404)"))
+            missing = [m for m in missing if m[0] not in gone]
+            claimed = inflight.claim([mid for mid, _, _ in missing], owner)
+            mine = [m for m in missing if m[0] in claimed]
+            others = [m for m in missing if m[0] not in claimed]
+            if mine:
+                _fetch_claimed(mine, owner, max_workers, results, fetched, on_done)
+            not_found = [mid for mid, _, _ in mine if lookups.is_not_found(results[mid][3])]
+            _store_fetched(fetched, owner, results, not_found)
+            fetched = []
+            if not others:
+                break
+            inflight.wait_released([mid for mid, _, _ in others])
+            with metrics.stage("load_features"):
+                loaded = features.load_matches([mid for mid, _, _ in others])
+            for mid, (timeline, match_details) in loaded.items():
+                memory_cache.set("match", mid, (timeline, match_details))
+                results[mid] = (mid, timeline, match_details, None)
+            if on_done:
+                on_done()
+            missing = [m for m in others if m[0] not in results]
+    finally:
+        inflight.release(owner)
+
+    if fetched:
+        _store_fetched(fetched, owner, results)
+    return [results[mid] for mid in match_ids]
 
 def get_participant_id_from_timeline(timeline, summoner_puuid):
     for i, p in enumerate(timeline['metadata']['participants']):
@@ -126,136 +537,153 @@ def get_participant_id_from_timeline(timeline, summoner_puuid):
     return None
 
 def analyze_minions(timeline, summoner_puuid):
-    target_time = 600000  # 10 min in ms
     participant_id = get_participant_id_from_timeline(timeline, summoner_puuid)
-    chosen_frame = None
-    for frame in timeline['info']['frames']:
-        if frame['timestamp'] >= target_time:
-            chosen_frame = frame
-            break
-    if chosen_frame is None:
-        chosen_frame = timeline['info']['frames'][-1]
-    p_frame = chosen_frame['participantFrames'].get(str(participant_id), {})
-    return p_frame.get('minionsKilled', 0)
-
-def analyze_kill_participation(match_details, summoner_puuid):
-    summoner_stats = None
-    team_id = None
-    for p in match_details['info']['participants']:
-        if p['puuid'] == summoner_puuid:
-            summoner_stats = p
-            team_id = p['teamId']
-            break
+    minions = run_extractors(timeline, None, [MinionsAt10])["minions_at_10"]
+    return minions.get(participant_id, 0)
+
+class MatchIndex:
+    """
+    Pre-indexed view of one match, built once and passed to every analyze_* function:
+    participants by puuid and by participantId, their teams, and kills per team.
+    """
+
+    def __init__(self, match_details):
+        self.participants_by_puuid = {}
+        self.participants_by_id = {}
+        self.team_by_participant_id = {}
+        self.team_kills = {}
+        for p in match_details['info']['participants']:
+            self.participants_by_puuid[p['puuid']] = p
+            self.participants_by_id[p['participantId']] = p
+            self.team_by_participant_id[p['participantId']] = p['teamId']
+            self.team_kills[p['teamId']] = self.team_kills.get(p['teamId'], 0) + p.get('kills', 0)
+
+    def participant(self, puuid):
+        return self.participants_by_puuid.get(puuid)
+
+def analyze_kill_participation(match_details, summoner_puuid, index=None):
+    index = index or MatchIndex(match_details)
+    summoner_stats = index.participant(summoner_puuid)
     if not summoner_stats:
         return 0
     kills = summoner_stats.get('kills', 0)
     assists = summoner_stats.get('assists', 0)
-    team_kills = sum(p.get('kills', 0) for p in match_details['info']['participants'] if p['teamId'] == team_id)
+    team_kills = index.team_kills[summoner_stats['teamId']]
     if team_kills == 0:
         return 0
     return (kills + assists) / team_kills * 100
 
-def analyze_first_structure(timeline, match_details, summoner_puuid):
-    summoner_team_id = None
-    for p in match_details['info']['participants']:
-        if p['puuid'] == summoner_puuid:
-            summoner_team_id = p['teamId']
-            break
-    if summoner_team_id is None:
+def analyze_first_structure(timeline, match_details, summoner_puuid, index=None):
+    index = index or MatchIndex(match_details)
+    summoner = index.participant(summoner_puuid)
+    if summoner is None:
         return None
+    first_ts = run_extractors(timeline, index, [FirstStructure])["first_structure"]
+    return first_ts.get(summoner['teamId'])
 
-    first_ts = None
-    for frame in timeline['info']['frames']:
-        for event in frame.get('events', []):
-            if event['type'] == 'BUILDING_KILL':
-                killer_id = event.get('killerId')
-                if killer_id is None:
-                    continue
-                # find killer's team
-                killer_team_id = None
-                for participant in match_details['info']['participants']:
-                    if participant['participantId'] == killer_id:
-                        killer_team_id = participant['teamId']
-                        break
-                if killer_team_id == summoner_team_id:
-                    t = event.get('timestamp')
-                    if t is not None:
-                        if first_ts is None or t < first_ts:
-                            first_ts = t
-    return first_ts
-
-def analyze_timeCCingOthers(match_details, summoner_puuid):
-    for p in match_details['info']['participants']:
-        if p['puuid'] == summoner_puuid:
-            # Ensure the key exists and is a valid number
-            return p.get('timeCCingOthers', 0) or 0
+def analyze_timeCCingOthers(match_details, summoner_puuid, index=None):
+    p = (index or MatchIndex(match_details)).participant(summoner_puuid)
+    if p:
+        # Ensure the key exists and is a valid number
+        return p.get('timeCCingOthers', 0) or 0
     return 0
 
-def analyze_assists(match_details, summoner_puuid):
-    for p in match_details['info']['participants']:
-        if p['puuid'] == summoner_puuid:
-            return p.get('assists', 0)
+def analyze_assists(match_details, summoner_puuid, index=None):
+    p = (index or MatchIndex(match_details)).participant(summoner_puuid)
+    if p:
+        return p.get('assists', 0)
     return 0
 
-def analyze_scuttle_crabs(match_details, summoner_puuid):
+def analyze_scuttle_crabs(match_details, summoner_puuid, index=None):
     # Use participant challenges for scuttle crab kills.
-    for p in match_details['info']['participants']:
-        if p['puuid'] == summoner_puuid:
-            challenges = p.get('challenges', {})
-            return challenges.get('scuttleCrabKills', 0)
+    p = (index or MatchIndex(match_details)).participant(summoner_puuid)
+    if p:
+        challenges = p.get('challenges', {})
+        return challenges.get('scuttleCrabKills', 0)
     return 0
 
-def analyze_ability_uses(match_details, summoner_puuid):
-    for p in match_details['info']['participants']:
-        if p['puuid'] == summoner_puuid:
-            challenges = p.get('challenges', {})
-            return challenges.get('abilityUses', 0)
+def analyze_ability_uses(match_details, summoner_puuid, index=None):
+    p = (index or MatchIndex(match_details)).participant(summoner_puuid)
+    if p:
+        challenges = p.get('challenges', {})
+        return challenges.get('abilityUses', 0)
     return 0
 
-def analyze_total_damage(match_details, summoner_puuid):
-    for p in match_details['info']['participants']:
-        if p['puuid'] == summoner_puuid:
-            return p.get('totalDamageDealtToChampions', 0)
+def analyze_total_damage(match_details, summoner_puuid, index=None):
+    p = (index or MatchIndex(match_details)).participant(summoner_puuid)
+    if p:
+        return p.get('totalDamageDealtToChampions', 0)
     return 0
 
-def get_champion(match_details, summoner_puuid):
-    for p in match_details['info']['participants']:
-        if p['puuid'] == summoner_puuid:
-            return p.get('championName', 'Unknown')
+def get_champion(match_details, summoner_puuid, index=None):
+    p = (index or MatchIndex(match_details)).participant(summoner_puuid)
+    if p:
+        return p.get('championName', 'Unknown')
     return 'Unknown'
 
+# Display names of the common queues; other queues fall back to info.gameMode
+QUEUE_MODES = {
+    400: "Normal Draft",
+    430: "Normal Blind",
+    420: "Ranked Solo",
+    440: "Ranked Flex",
+    450: "ARAM",
+    700: "Clash"
+}
+
 def get_game_mode(match_details):
     queue_id = match_details['info'].get('queueId', 0)
-    mapping = {
-        400: "Normal Draft",
-        430: "Normal Blind",
-        420: "Ranked Solo",
-        440: "Ranked Flex",
-        450: "ARAM",
-        700: "Clash"
+    return QUEUE_MODES.get(queue_id, match_details['info'].get('gameMode', 'Unknown'))
+
+def _analysis_row(match_details, summoner_puuid, index, timeline_metrics, participant_id):
+    summoner = index.participant(summoner_puuid)
+    # Convert timestamp to human-readable date
+    game_dt = match_details['info'].get('gameStartTimestamp', 0)
+    return {
+        "game_datetime": datetime.fromtimestamp(game_dt / 1000).strftime("%Y-%m-%d %H:%M:%S"),
+        "game_start_ts": game_dt,
+        # Game duration from match details (assumed to be in seconds)
+        "game_duration": match_details['info'].get('gameDuration', 0),
+        "champion": get_champion(match_details, summoner_puuid, index),
+        "game_mode": get_game_mode(match_details),
+        "minions_at_10": timeline_metrics["minions_at_10"].get(participant_id, 0),
+        "kill_part": analyze_kill_participation(match_details, summoner_puuid, index),
+        "first_struct": timeline_metrics["first_structure"].get(summoner['teamId']) if summoner else None,
+        "assists": analyze_assists(match_details, summoner_puuid, index),
+        "scuttles": analyze_scuttle_crabs(match_details, summoner_puuid, index),
+        "ability_uses": analyze_ability_uses(match_details, summoner_puuid, index),
+        "total_damage": analyze_total_damage(match_details, summoner_puuid, index),
+        "time_ccing_others": analyze_timeCCingOthers(match_details, summoner_puuid, index),
     }
-    return mapping.get(queue_id, match_details['info'].get('gameMode', 'Unknown'))
 
+def analyze_match(timeline, match_details, summoner_puuid, index=None):
+    """Compute the full analysis row for one summoner in one match (keyword args of store_analysis_result)."""
+    index = index or MatchIndex(match_details)
+    # One pass over the timeline for every timeline metric
+    timeline_metrics = run_extractors(timeline, index)
+    participant_id = get_participant_id_from_timeline(timeline, summoner_puuid)
+    return _analysis_row(match_details, summoner_puuid, index, timeline_metrics, participant_id)
 
+def analyze_match_all(timeline, match_details, index=None):
+    """analyze_match() for all ten participants at once, as {puuid: row}; the timeline is walked only once."""
+    index = index or MatchIndex(match_details)
+    timeline_metrics = run_extractors(timeline, index)
+    return dict(
+        (puuid, _analysis_row(match_details, puuid, index, timeline_metrics, i + 1))
+        for i, puuid in enumerate(timeline['metadata']['participants'])
+    )
 
 def store_analysis_result(summoner_name, match_id, game_datetime, game_duration,
                           champion, game_mode,
                           minions_at_10, kill_part, first_struct,
-                          assists, scuttles, ability_uses, total_damage, time_ccing_others):
+                          assists, scuttles, ability_uses, total_damage, time_ccing_others,
+                          puuid=None, game_start_ts=None):
     """
     Store the final per-match stats in the 'analysis' table.
-    If the row already exists for (summoner_name, match_id), it is replaced.
+    If the row already exists for (summoner_name, match_id), it is replaced, unless it
+    belongs to another player (another puuid): then nothing is stored.
     """
-    conn = sqlite3.connect(CACHE_DB)
-    c = conn.cursor()
-    c.execute('''
-        REPLACE INTO analysis (
-            summoner_name, match_id, game_datetime, game_duration, champion, gameMode,
-            minions_at_10, kill_participation, first_structure_ts,
-            assists, scuttle_crabs, abilityUses, total_damage_dealt, time_ccing_others
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+    row = dict(zip(ANALYSIS_COLUMNS + ["puuid", "game_start_ts"], (
         summoner_name,
         match_id,
         game_datetime,
@@ -269,23 +697,277 @@ def store_analysis_result(summoner_name, match_id, game_datetime, game_duration,
         scuttles,
         ability_uses,
         total_damage,
-        time_ccing_others
-    ))
-    conn.commit()
-    conn.close()
+        time_ccing_others,
+        puuid,
+        game_start_ts
+    )))
+    with transaction() as conn:
+        # Keep the summary tables in step: take out the row being replaced, add the new one
+        old = conn.execute(
+            f"SELECT {', '.join(ANALYSIS_COLUMNS)}, puuid FROM analysis WHERE summoner_name = ? AND match_id = ?",
+            (summoner_name, match_id)
+        ).fetchone()
+        if old and old[-1] and puuid and old[-1] != puuid:
+            print(f"⚠️ {match_id}: '{summoner_name}' is already stored for another player, not replaced")
+            return
+        if old:
+            stats.apply_row(conn, dict(zip(ANALYSIS_COLUMNS, old)), -1)
+        conn.execute(f'''
+            REPLACE INTO analysis ({', '.join(row)})
+            VALUES ({', '.join('?' * len(row))})
+        ''', tuple(row.values()))
+        stats.apply_row(conn, row)
+        stats.refresh_rolling(conn, summoner_name, game_start_ts)
+
+def reuse_stored_analysis(summoner_name, puuid, match_ids):
+    """
+    Return the match IDs that already have an analysis row for `puuid`. Rows stored
+    under another name (e.g. by a whole-match pass for a teammate) are copied to
+    `summoner_name` straight from the table, without loading the cached match JSON.
+    """
+    rows = []
+    for chunk in chunked(match_ids):
+        rows += get_connection().execute(
+            "SELECT match_id, summoner_name FROM analysis "
+            f"WHERE puuid = ? AND match_id IN ({','.join('?' * len(chunk))})",
+            (puuid, *chunk)
+        ).fetchall()
+    known = set(mid for mid, _ in rows)
+    to_copy = known - set(mid for mid, name in rows if name == summoner_name)
+    if to_copy:
+        columns = ANALYSIS_COLUMNS[2:] + ["puuid", "game_start_ts"]
+        with transaction() as conn:
+            for mid in to_copy:
+                values = conn.execute(
+                    f"SELECT {', '.join(columns)} FROM analysis WHERE puuid = ? AND match_id = ? LIMIT 1",
+                    (puuid, mid)
+                ).fetchone()
+                row = dict(zip(STORE_ARGUMENTS, values))
+                store_analysis_result(summoner_name, mid, **row)
+    return known
+
+def analyze_and_store_matches(summoner_name, puuid, match_ids, max_workers=FETCH_WORKERS,
+                              whole_match=ANALYZE_WHOLE_MATCH, progress=None):
+    """
+    Fetch (in parallel), analyze and store every match in match_ids for one summoner.
+    Matches already analyzed for this puuid are skipped. With whole_match, rows for
+    all ten participants are stored on the first pass.
+    `progress(completed, total)` reports how many of match_ids are loaded so far.
+    Returns a list of (match_id, error) for the matches that could not be analyzed.
+    """
+    known = reuse_stored_analysis(summoner_name, puuid, match_ids)
+    todo = [mid for mid in match_ids if mid not in known]
+
+    fetch_progress = None
+    if progress:
+        fetch_progress = lambda done, _: progress(len(known) + done, len(match_ids))
+
+    failures = []
+    rows = []
+    with metrics.stage("fetch"):
+        loaded = fetch_matches(todo, max_workers, fetch_progress)
+    for mid, timeline, match_details, error in loaded:
+        if error is None:
+            try:
+                with metrics.stage("analyze"):
+                    if whole_match:
+                        index = MatchIndex(match_details)
+                        for p_puuid, row in analyze_match_all(timeline, match_details, index).items():
+                            name = summoner_name
+                            if p_puuid != puuid:
+                                name = get_participant_riot_id(index.participant(p_puuid))
+                            rows.append((name, mid, p_puuid, row))
+                    else:
+                        rows.append((summoner_name, mid, puuid, analyze_match(timeline, match_details, puuid)))
+                continue
+            except Exception as e:
+                error = e
+        failures.append((mid, error))
+
+    with metrics.stage("store"), transaction():
+        for name, mid, p_puuid, row in rows:
+            store_analysis_result(name, mid, puuid=p_puuid, **row)
+    metrics.inc("matches_analyzed", len(todo) - len(failures))
+    metrics.inc("match_failures", len(failures))
+    return failures
+
+def get_sync_state(puuid):
+    row = get_connection().execute(
+        "SELECT newest_game_start, oldest_game_start, match_count FROM sync_state WHERE puuid = ?", (puuid,)
+    ).fetchone()
+    if row is None or row[0] is None:
+        return None
+    return {"newest_game_start": row[0], "oldest_game_start": row[1], "match_count": row[2]}
+
+def advance_sync_state(puuid, match_ids, state):
+    """
+    Extend the stored range of `puuid` (`state`, or None to start over) by match_ids,
+    which must all be stored in 'analysis' by now.
+    """
+    if not match_ids:
+        return
+    placeholders = ",".join("?" * len(match_ids))
+    newest, oldest = get_connection().execute(
+        f"SELECT MAX(game_start_ts), MIN(game_start_ts) FROM analysis WHERE puuid = ? AND match_id IN ({placeholders})",
+        (puuid, *match_ids)
+    ).fetchone()
+    if newest is None:
+        return
+    match_count = len(match_ids)
+    if state is not None:
+        newest = max(newest, state["newest_game_start"])
+        oldest = min(oldest, state["oldest_game_start"])
+        match_count += state["match_count"]
+    with transaction() as conn:
+        conn.execute(
+            "REPLACE INTO sync_state (puuid, newest_game_start, oldest_game_start, match_count) VALUES (?, ?, ?, ?)",
+            (puuid, newest, oldest, match_count)
+        )
+
+def sync_match_ids(puuid, count):
+    """
+    Match IDs needed so that the `count` most recent games of `puuid` are stored.
+    With a sync watermark, only games newer than the newest synced one are listed,
+    and older history is paged in (backfill) until the stored range holds `count`
+    games. Returns (match_ids, state) where state is the watermark to extend
+    (None: start a new range).
+    """
+    state = get_sync_state(puuid)
+    if state is None:
+        return get_all_match_ids(puuid, count), None
+
+    new_ids = get_all_match_ids(puuid, count, start_time=state["newest_game_start"] // 1000 + 1)
+    if len(new_ids) >= count:
+        # More new games than requested: the old range is no longer contiguous
+        return new_ids, None
+
+    backfill = []
+    missing = count - len(new_ids) - state["match_count"]
+    if missing > 0:
+        backfill = get_all_match_ids(puuid, missing, end_time=state["oldest_game_start"] // 1000 - 1)
+    return new_ids + backfill, state
+
+def refresh_summoner(summoner_name, puuid, count, whole_match=ANALYZE_WHOLE_MATCH, max_workers=FETCH_WORKERS,
+                     progress=None):
+    """
+    Sync and analyze the `count` most recent games of one summoner.
+    Returns (match_ids, failures) for the matches that had to be processed.
+    """
+    match_ids, state = sync_match_ids(puuid, count)
+    failures = analyze_and_store_matches(summoner_name, puuid, match_ids, max_workers, whole_match, progress)
+    if all(lookups.is_not_found(err) for _, err in failures):
+        # On failure the watermark stays put, so the next refresh lists those games again
+        # (unless Riot no longer has them)
+        advance_sync_state(puuid, match_ids, state)
+    return match_ids, failures
+
+def refresh_roster(count, whole_match=ANALYZE_WHOLE_MATCH, max_workers=FETCH_WORKERS, progress=None):
+    """
+    Sync and analyze the `count` most recent games of every roster member at once.
+    Matches shared by several members are fetched, decoded and walked only once, so
+    the work grows with the number of unique matches. Returns a report dict with
+    summoners, matches (unique), pairs (summoner x match rows) and failures
+    [(match_id, error)].
+    """
+    plans = []
+    wanted = {}  # match_id -> [(name, puuid)] of the members still missing it
+    for name, member in roster.load_roster().items():
+        if not member["puuid"]:
+            continue
+        match_ids, state = sync_match_ids(member["puuid"], count)
+        known = reuse_stored_analysis(name, member["puuid"], match_ids)
+        todo = [mid for mid in match_ids if mid not in known]
+        plans.append((name, member["puuid"], match_ids, state, todo))
+        for mid in todo:
+            wanted.setdefault(mid, []).append((name, member["puuid"]))
+
+    failures = {}
+    rows = []
+    with metrics.stage("fetch"):
+        loaded = fetch_matches(list(wanted), max_workers, progress)
+    for mid, timeline, match_details, error in loaded:
+        if error is None:
+            try:
+                with metrics.stage("analyze"):
+                    # One timeline walk serves every member who played the match
+                    index = MatchIndex(match_details)
+                    names = dict((puuid, name) for name, puuid in wanted[mid])
+                    for puuid, row in analyze_match_all(timeline, match_details, index).items():
+                        if puuid in names:
+                            rows.append((names[puuid], mid, puuid, row))
+                        elif whole_match:
+                            rows.append((get_participant_riot_id(index.participant(puuid)), mid, puuid, row))
+                continue
+            except Exception as e:
+                error = e
+        failures[mid] = error
+
+    with metrics.stage("store"), transaction():
+        for name, mid, puuid, row in rows:
+            store_analysis_result(name, mid, puuid=puuid, **row)
+    refreshed = []
+    for name, puuid, match_ids, state, todo in plans:
+        if all(lookups.is_not_found(failures[mid]) for mid in todo if mid in failures):
+            advance_sync_state(puuid, match_ids, state)
+            refreshed.append(name)
+    roster.mark_refreshed(refreshed)
+    metrics.inc("matches_analyzed", len(wanted) - len(failures))
+    metrics.inc("match_failures", len(failures))
+    return {
+        "summoners": len(plans),
+        "matches": len(wanted),
+        "pairs": sum(len(todo) for *_, todo in plans),
+        "failures": list(failures.items()),
+    }
+
+def get_analysis_rows_for_summoner(summoner_name):
+    """The 'analysis' table rows (ANALYSIS_COLUMNS tuples) of the given summoner_name."""
+    return get_connection().execute(
+        f"SELECT {', '.join(ANALYSIS_COLUMNS)} FROM analysis WHERE summoner_name = ?", (summoner_name,)
+    ).fetchall()
 
-def get_analysis_data_for_summoner(summoner_name):
+def _like_pattern(text):
+    """LIKE pattern matching `text` anywhere, with its % and _ taken literally."""
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def query_analysis_page(summoner_name, start=0, length=10, order_column="game_datetime", order_dir="desc",
+                        search="", column_search=None):
     """
-    Returns a Pandas DataFrame of the 'analysis' table rows for the given summoner_name.
+    One page of a summoner's analysis rows, filtered, sorted and paged in SQL.
+    `search` matches any SEARCHABLE_COLUMNS, `column_search` maps column -> substring,
+    and length -1 returns every row. Returns (records_total, records_filtered, DataFrame).
     """
-    conn = sqlite3.connect(CACHE_DB)
+    # pandas is imported on first use: it would dominate the start-up time otherwise
+    import pandas as pd
+    if order_column not in ANALYSIS_COLUMNS:
+        raise ValueError(f"Cannot sort by '{order_column}'.")
+    direction = "DESC" if str(order_dir).lower() == "desc" else "ASC"
+
+    conn = get_connection()
+    where = ["summoner_name = ?"]
+    params = [summoner_name]
+    records_total = conn.execute("SELECT COUNT(*) FROM analysis WHERE summoner_name = ?", params).fetchone()[0]
+
+    if search:
+        where.append("(" + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in SEARCHABLE_COLUMNS) + ")")
+        params += [_like_pattern(search)] * len(SEARCHABLE_COLUMNS)
+    for column, value in (column_search or {}).items():
+        if column in ANALYSIS_COLUMNS and value:
+            where.append(f"CAST({column} AS TEXT) LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(value))
+    where_sql = " AND ".join(where)
+
+    records_filtered = records_total
+    if len(where) > 1:
+        records_filtered = conn.execute(f"SELECT COUNT(*) FROM analysis WHERE {where_sql}", params).fetchone()[0]
+
     df = pd.read_sql_query(
-        "SELECT * FROM analysis WHERE summoner_name = ?",
+        f"SELECT {', '.join(ANALYSIS_COLUMNS)} FROM analysis WHERE {where_sql} "
+        f"ORDER BY {SORT_COLUMNS.get(order_column, order_column)} {direction}, match_id {direction} LIMIT ? OFFSET ?",
         conn,
-        params=(summoner_name,)
+        params=(*params, int(length), int(start))
     )
-    conn.close()
-    return df
+    return records_total, records_filtered, df
 
 # -- Helper functions for final display formatting --
 
@@ -310,18 +992,139 @@ def format_kill_participation(value):
     """Round to two decimals and append '%'."""
     return f"{value:.2f}%"
 
+def render_table(headers, rows):
+    """Plain-text table of `rows` under `headers`, right-aligned like DataFrame.to_string(index=False)."""
+    cells = [[str(value) for value in row] for row in rows]
+    widths = [max([len(header)] + [len(row[i]) for row in cells]) for i, header in enumerate(headers)]
+    lines = [" ".join(header.rjust(width) for header, width in zip(headers, widths))]
+    for row in cells:
+        lines.append(" ".join(value.rjust(width) for value, width in zip(row, widths)))
+    return "\n".join(lines)
+
 def get_all_summoners_from_db():
-    conn = sqlite3.connect("riot_cache.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT summoner_name FROM analysis")
-    results = cursor.fetchall()
-    conn.close()
-    return sorted(set(row[0] for row in results))
+    results = get_connection().execute("SELECT DISTINCT summoner_name FROM analysis ORDER BY summoner_name").fetchall()
+    return [row[0] for row in results]
+
+def get_summoner_puuids(names):
+    """
+    {summoner_name: puuid} of analysis-table names: the puuid of the name's newest
+    analysis row, else of the most recently confirmed Riot ID with that game name
+    (several players can share one).
+    """
+    names = list(names)
+    found = lookups.puuids_by_game_name(names)
+    conn = get_connection()
+    for chunk in chunked(names):
+        # SQLite takes the bare puuid column from the row holding MAX(game_start_ts)
+        found.update((name, puuid) for name, puuid, _ in conn.execute(
+            "SELECT summoner_name, puuid, MAX(game_start_ts) FROM analysis "
+            f"WHERE summoner_name IN ({','.join('?' * len(chunk))}) AND puuid IS NOT NULL "
+            "GROUP BY summoner_name", chunk
+        ))
+    return found
 
-def main():
-    init_db()
+def migrate_cache(codec_name, batch_size):
+    """Re-encode the raw cache with another codec and print the size / decode-time savings."""
+    print(f"Rewriting cached timelines and match details with codec '{codec_name}' ...")
+    report = migrate_cache_codec(codec_name, batch_size=batch_size)
+    for table, r in report.items():
+        if not r["rows"]:
+            print(f"{table}: empty")
+            continue
+        mb_before = r["bytes_before"] / 1e6
+        mb_after = r["bytes_after"] / 1e6
+        ms_before = r["decode_before"] / r["rows"] * 1000
+        ms_after = r["decode_after"] / r["rows"] * 1000
+        print(f"{table}: {r['rows']} rows, {mb_before:.1f} MB -> {mb_after:.1f} MB "
+              f"({mb_after / mb_before * 100 if mb_before else 0:.0f}%), "
+              f"decode {ms_before:.2f} ms -> {ms_after:.2f} ms per row")
+    print("Run 'python cli.py compact' to return the freed pages to the filesystem.")
 
-    summoners = load_custom_summoners()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze recent League of Legends matches.")
+    parser.add_argument("--whole-match", action="store_true", default=ANALYZE_WHOLE_MATCH,
+                        help="store analysis rows for all ten participants of each match")
+    subcommands = parser.add_subparsers(dest="command")
+    subcommands.add_parser("upgrade", help="upgrade the schema and run its data backfills (before starting the web app)")
+    migrate = subcommands.add_parser("migrate-cache", help="re-encode cached raw match data with a storage codec")
+    migrate.add_argument("--codec", default=None, help="json, zlib, zstd or msgpack (default: CACHE_CODEC)")
+    migrate.add_argument("--batch-size", type=int, default=200, help="rows rewritten per transaction")
+    refresh = subcommands.add_parser("refresh-roster", help="sync and analyze every tracked summoner (non-interactive)")
+    refresh.add_argument("--count", type=int, default=20, help="most recent games per summoner")
+    subcommands.add_parser("prune-raw", help="delete raw match JSON already extracted into the feature tables")
+    subcommands.add_parser("reextract-features",
+                           help="rewrite the feature tables from the raw match JSON still cached (then run backfill)")
+    compact_parser = subcommands.add_parser("compact", help="apply the raw-cache retention policy and shrink riot_cache.db")
+    compact_parser.add_argument("--max-age-days", type=float, default=RAW_RETENTION_DAYS,
+                                help="drop raw JSON of games older than this (0: no limit)")
+    compact_parser.add_argument("--max-raw-mb", type=float, default=RAW_CACHE_MAX_MB,
+                                help="then drop the oldest games' raw JSON beyond this size (0: no limit)")
+    subcommands.add_parser("rebuild-stats", help="recompute the per-summoner summary tables from the analysis table")
+    batch = subcommands.add_parser("batch-analyze", help="recompute analysis rows from the raw cache with vectorized code")
+    batch.add_argument("--all-participants", action="store_true", help="store rows for every participant of every match")
+    batch.add_argument("--chunk-size", type=int, default=500, help="matches decoded and computed per chunk")
+    batch.add_argument("--check-parity", action="store_true", help="compare every row with the scalar analyzers")
+    backfill = subcommands.add_parser("backfill", help="recompute analysis rows from the raw cache on a process pool")
+    backfill.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    backfill.add_argument("--chunk-size", type=int, default=200, help="matches per work unit")
+    backfill.add_argument("--run", default="default", help="checkpoint name; a run resumes where it stopped")
+    backfill.add_argument("--restart", action="store_true", help="drop the run's checkpoint and start over")
+    backfill.add_argument("--all-participants", action="store_true", help="store rows for every participant of every match")
+    args = parser.parse_args(argv)
+
+    init_db(with_backfills=True)
+
+    if args.command == "upgrade":
+        print("✅ Schema up to date.")
+        return
+    if args.command == "migrate-cache":
+        migrate_cache(args.codec or CACHE_CODEC, args.batch_size)
+        return
+    if args.command == "batch-analyze":
+        # Imported here: it depends on this module
+        from batch_analyzer import batch_analyze
+        report = batch_analyze(args.all_participants, args.chunk_size, check_parity=args.check_parity)
+        print(f"Recomputed {report['rows']} rows from {report['matches']} matches in {report['seconds']:.1f}s "
+              f"({report['matches'] / report['seconds'] if report['seconds'] else 0:.0f} matches/s)")
+        if args.check_parity:
+            for match_id, puuid, key, got, want in report["mismatches"][:20]:
+                print(f"❌ {match_id} {puuid} {key}: batch={got!r} scalar={want!r}")
+            print(f"Parity check: {len(report['mismatches'])} mismatches")
+        return
+    if args.command == "backfill":
+        from backfill import run_backfill
+        report = run_backfill(args.run, args.workers, args.chunk_size, args.all_participants, args.restart)
+        print(f"✅ Backfilled {report['rows']} rows from {report['matches']} matches in {report['seconds']:.1f}s")
+        return
+    if args.command == "refresh-roster":
+        report = refresh_roster(args.count, whole_match=args.whole_match)
+        print(f"🔄 Refreshed {report['summoners']} summoners: {report['matches']} unique matches "
+              f"for {report['pairs']} summoner/match rows")
+        for mid, err in report["failures"]:
+            print(f"❌ Failed to analyze match {mid}: {err}")
+        api_stats = get_scheduler_stats()
+        print(f"Riot API: {api_stats['requests']} requests, {api_stats['rate_limited']} rate-limited")
+        return
+    if args.command == "reextract-features":
+        print(f"🔁 Re-extracted the features of {features.extract_from_raw(reextract=True)} matches from the raw cache.")
+        return
+    if args.command == "prune-raw":
+        print(f"🧹 Deleted {features.prune_raw()} raw cache rows. Run 'compact' to return the space to the filesystem.")
+        return
+    if args.command == "compact":
+        pruned = features.apply_raw_retention(args.max_age_days or None, int(args.max_raw_mb * 1024 * 1024) or None)
+        freed = compact()
+        print(f"🧹 Pruned the raw JSON of {pruned} matches and freed {freed / 1024 / 1024:.1f} MB.")
+        return
+    if args.command == "rebuild-stats":
+        stats.rebuild_stats()
+        print("Summary tables rebuilt.")
+        return
+
+    interactive_analysis(args.whole_match)
+
+def interactive_analysis(whole_match=ANALYZE_WHOLE_MATCH):
+    summoners = roster.load_roster()
 
     print("Select summoner to analyze:")
     summoner_keys = list(summoners.keys())
@@ -338,7 +1141,7 @@ def main():
             summoner_data = get_summoner_by_riot_id(game_name, tag_line)
             puuid = summoner_data["puuid"]
             summoner_name = summoner_data["gameName"]
-            save_custom_summoner(summoner_name, puuid)
+            roster.save_summoner(summoner_name, puuid)
         except Exception as e:
             print("Error retrieving summoner data:", e)
             return
@@ -355,86 +1158,58 @@ def main():
     # Determine how many recent matches to analyze
     count = int(input("How many recent games to analyze?: "))
 
-    # Retrieve match IDs
-    url = f'https://{REGION}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids?count={count}'
-    headers = {'X-Riot-Token': API_KEY}
-    resp = requests.get(url, headers=headers)
-    resp.raise_for_status()
-    match_ids = resp.json()
+    # Sync new match IDs and analyze them
+    print(f"Syncing the {count} most recent games ...")
+    match_ids, failures = refresh_summoner(summoner_name, puuid, count, whole_match=whole_match)
+    print(f"Analyzed {len(match_ids) - len(failures)} new matches.")
+    for mid, err in failures:
+        print(f"❌ Failed to analyze match {mid}: {err}")
 
-    for mid in match_ids:
-        print(f"Analyzing match {mid} ...")
-        # Retrieve from cache or API
-        timeline = get_match_timeline_cached(mid)
-        match_details = get_match_details_cached(mid)
-
-        # Extract data
-        minions_10 = analyze_minions(timeline, puuid)
-        kill_part = analyze_kill_participation(match_details, puuid)
-        first_struct = analyze_first_structure(timeline, match_details, puuid)
-        assists = analyze_assists(match_details, puuid)
-        scuttles = analyze_scuttle_crabs(match_details, puuid)
-        ability_uses = analyze_ability_uses(match_details, puuid)
-        total_damage = analyze_total_damage(match_details, puuid)
-        time_ccing_others = analyze_timeCCingOthers(match_details, puuid)  # New analysis
-        champion = get_champion(match_details, puuid)
-        game_mode = get_game_mode(match_details)
-        # Extract game duration from match details (assumed to be in seconds)
-        game_duration = match_details['info'].get('gameDuration', 0)
-
-        # Convert timestamp to human-readable date
-        game_dt = match_details['info'].get('gameStartTimestamp', 0)
-        game_dt_readable = datetime.fromtimestamp(game_dt / 1000).strftime("%Y-%m-%d %H:%M:%S")
-
-        store_analysis_result(
-            summoner_name,
-            mid,
-            game_dt_readable,
-            game_duration,
-            champion,
-            game_mode,
-            minions_10,
-            kill_part,
-            first_struct if first_struct else 0,
-            assists,
-            scuttles,
-            ability_uses,
-            total_damage,
-            time_ccing_others
-        )
+    api_stats = get_scheduler_stats()
+    print(f"Riot API: {api_stats['requests']} requests, {api_stats['rate_limited']} rate-limited, "
+          f"{api_stats['wait_seconds']:.1f}s waiting for rate limits, {api_stats['fetch_seconds']:.1f}s fetching")
+    cache_stats = get_cache_stats()
+    hits = sum(c["hits"] for c in cache_stats["kinds"].values())
+    misses = sum(c["misses"] for c in cache_stats["kinds"].values())
+    print(f"Memory cache: {hits} hits, {misses} misses, {cache_stats['entries']} entries "
+          f"({cache_stats['bytes'] / 1e6:.1f} of {cache_stats['max_bytes'] / 1e6:.0f} MB)")
 
     # Retrieve and show analysis results
-    df = get_analysis_data_for_summoner(summoner_name)
+    rows = get_analysis_rows_for_summoner(summoner_name)
 
     # -- Final formatting before printing --
-    if not df.empty:
+    columns = dict((column, i) for i, column in enumerate(ANALYSIS_COLUMNS))
+    formatted = []
+    for row in rows:
+        row = list(row)
         # Format game_duration as mm:ss
-        df['game_duration'] = df['game_duration'].apply(format_game_duration)
+        row[columns['game_duration']] = format_game_duration(row[columns['game_duration']])
         # Format first_structure_ts as ss:ms
-        df['first_structure_ts'] = df['first_structure_ts'].apply(format_first_structure_ts)
+        row[columns['first_structure_ts']] = format_first_structure_ts(row[columns['first_structure_ts']])
         # Format kill_participation to two decimals plus '%'
-        df['kill_participation'] = df['kill_participation'].apply(format_kill_participation)
-
-        # Rename columns for better readability
-        df.rename(columns={
-            'summoner_name': 'Summoner',
-            'match_id': 'Match ID',
-            'game_datetime': 'Date & Time',
-            'game_duration': 'Duration',
-            'champion': 'Champion',
-            'gameMode': 'Mode',
-            'minions_at_10': 'Minions @10',
-            'kill_participation': 'KP%',
-            'first_structure_ts': '1st Tower',
-            'assists': 'Assists',
-            'scuttle_crabs': 'Crabs',
-            'abilityUses': 'Abilities',
-            'total_damage_dealt': 'Damage',
-            'time_ccing_others': 'CC Time'  # Add this column for display
-        }, inplace=True)
+        row[columns['kill_participation']] = format_kill_participation(row[columns['kill_participation']] or 0)
+        formatted.append(row)
+
+    # Column names for better readability
+    headers = {
+        'summoner_name': 'Summoner',
+        'match_id': 'Match ID',
+        'game_datetime': 'Date & Time',
+        'game_duration': 'Duration',
+        'champion': 'Champion',
+        'gameMode': 'Mode',
+        'minions_at_10': 'Minions @10',
+        'kill_participation': 'KP%',
+        'first_structure_ts': '1st Tower',
+        'assists': 'Assists',
+        'scuttle_crabs': 'Crabs',
+        'abilityUses': 'Abilities',
+        'total_damage_dealt': 'Damage',
+        'time_ccing_others': 'CC Time'
+    }
 
     print("\nAnalysis results from 'analysis' table:")
-    print(df.to_string(index=False))
+    print(render_table([headers[column] for column in ANALYSIS_COLUMNS], formatted))
 
 if __name__ == "__main__":
     main()
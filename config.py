@@ -1,23 +1,73 @@
 import os
-import json
 from dotenv import load_dotenv
 
 load_dotenv()
 
 API_KEY = os.getenv("RIOT_API_KEY")
-REGION = 'europe'
+# Home cluster: account lookups, and matches / players whose cluster is not known
+REGION = os.getenv("RIOT_REGION", "europe")
+# Where API requests go ({region} is replaced by the cluster: americas, asia, europe,
+# sea); point it at bench/fake_riot.py for local benchmarks
+RIOT_API_BASE = os.getenv("RIOT_API_BASE", "https://{region}.api.riotgames.com").rstrip("/")
 CACHE_DB = "riot_cache.db"
+# Seconds a SQLite writer waits for another worker's lock before "database is locked"
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+# Codec for newly cached timeline / match_details blobs: json, zlib, zstd or msgpack
+# (zstd and msgpack need the zstandard / msgpack packages)
+CACHE_CODEC = os.getenv("CACHE_CODEC", "zlib")
+# Keep the raw timeline / match_details JSON of fetched matches next to the extracted
+# feature tables (analysis only reads the features; set to 0 to skip the cold copy)
+CACHE_RAW_MATCHES = os.getenv("CACHE_RAW_MATCHES", "1") == "1"
+# Retention of that raw copy, enforced by 'cli.py compact': blobs of games older than
+# RAW_RETENTION_DAYS are dropped, then the oldest games' until the raw tables fit in
+# RAW_CACHE_MAX_MB (0: no limit)
+RAW_RETENTION_DAYS = float(os.getenv("RAW_RETENTION_DAYS", "0"))
+RAW_CACHE_MAX_MB = float(os.getenv("RAW_CACHE_MAX_MB", "0"))
+# Store analysis rows for all ten participants of every analyzed match, so teammates
+# analyzed later are served straight from the 'analysis' table
+ANALYZE_WHOLE_MATCH = os.getenv("ANALYZE_WHOLE_MATCH", "0") == "1"
+# Background analysis jobs of the web app: worker threads per process, and seconds
+# without progress after which a queued/running job counts as lost
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+# Sizes of the "last N games" windows kept in the rolling stats table
+STATS_ROLLING_WINDOWS = [int(n) for n in os.getenv("STATS_ROLLING_WINDOWS", "10,20,50").split(",")]
+# In-process LRU cache in front of SQLite and the API: size bound (MB) and seconds
+# to live per kind of entry (None: kept until evicted; match data never changes)
+MEMORY_CACHE_BYTES = int(float(os.getenv("MEMORY_CACHE_MB", "64")) * 1024 * 1024)
+MEMORY_CACHE_TTLS = {
+    "match": None,
+    "match-ids": int(os.getenv("MEMORY_CACHE_MATCH_IDS_TTL", "60")),
+    "account": int(os.getenv("MEMORY_CACHE_ACCOUNT_TTL", "600")),
+    "account-region": int(os.getenv("MEMORY_CACHE_ACCOUNT_TTL", "600")),
+}
+# Lookup cache in riot_cache.db (see lookups.py): seconds a Riot ID -> puuid mapping
+# is trusted before account-v1 is asked again, seconds a Riot ID that was not found
+# stays "not found", and the same for matches (a day by default: a match can 404 until
+# Riot publishes it shortly after the game ends; 0 opts in to "for good")
+LOOKUP_ACCOUNT_TTL = int(os.getenv("LOOKUP_ACCOUNT_TTL", "86400"))
+LOOKUP_NOT_FOUND_TTL = int(os.getenv("LOOKUP_NOT_FOUND_TTL", "300"))
+LOOKUP_MATCH_NOT_FOUND_TTL = int(os.getenv("LOOKUP_MATCH_NOT_FOUND_TTL", "86400"))
+# Instrumentation (see metrics.py): recent request / job traces kept per process, and
+# the opt-in sampling profiler writing one folded-stack file per trace to PROFILE_DIR
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "200"))
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Roster file of older versions, imported into the 'roster' table once
 CUSTOM_SUMMONERS_FILE = "summoners.json"
-
-def load_custom_summoners():
-    if not os.path.exists(CUSTOM_SUMMONERS_FILE):
-        return {}
-    with open(CUSTOM_SUMMONERS_FILE, 'r') as f:
-        return json.load(f)
-
-def save_custom_summoner(name, puuid):
-    custom = load_custom_summoners()
-    if name not in custom:
-        custom[name] = {"name": name, "puuid": puuid}
-        with open(CUSTOM_SUMMONERS_FILE, 'w') as f:
-            json.dump(custom, f, indent=2)
\ No newline at end of file
+# Max parallel Riot API fetches when loading a batch of matches
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+# A match being fetched by one process is locked for the others (shared through
+# riot_cache.db); a lock not refreshed for this many seconds counts as abandoned
+FETCH_LOCK_STALE_SECONDS = float(os.getenv("FETCH_LOCK_STALE_SECONDS", "60"))
+FETCH_LOCK_POLL_SECONDS = float(os.getenv("FETCH_LOCK_POLL_SECONDS", "0.2"))
+# App rate limit assumed until Riot's X-App-Rate-Limit header tells us the real one
+# (the default is the development key limit)
+RIOT_APP_RATE_LIMIT = os.getenv("RIOT_APP_RATE_LIMIT", "20:1,100:120")
+# How often a 429 response is retried (after its Retry-After) before giving up
+RIOT_MAX_RETRIES = int(os.getenv("RIOT_MAX_RETRIES", "3"))
+# Keep-alive HTTP session of each cluster: pooled connections per cluster and timeouts (seconds)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", str(FETCH_WORKERS)))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
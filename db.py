@@ -0,0 +1,249 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from config import CACHE_DB, SQLITE_BUSY_TIMEOUT, CACHE_CODEC
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_local = threading.local()
+# Host parameters per IN (...) list: older SQLite builds allow 999 per statement
+IN_BATCH = 500
+
+
+def _connect():
+    # Autocommit mode: transactions are opened explicitly by transaction() below
+    conn = sqlite3.connect(CACHE_DB, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+    # Takes effect only on a new database (before the WAL switch writes its header);
+    # lets compact() free pages without a full VACUUM
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # safe with WAL, no fsync per commit
+    conn.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+    conn.execute("PRAGMA cache_size=-32000")  # ~32 MB page cache
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+
+def get_connection():
+    """
+    Long-lived connection for the current thread (and process: gunicorn forks
+    workers, and a connection must never cross a fork).
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.depth = 0
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    Run the enclosed writes in one transaction. Nested uses join the outermost one,
+    so a whole batch of matches is committed once instead of row by row.
+    """
+    conn = get_connection()
+    if _local.depth == 0:
+        # IMMEDIATE takes the write lock up front, so concurrent writers wait on
+        # busy_timeout instead of failing with "database is locked" on upgrade
+        conn.execute("BEGIN IMMEDIATE")
+    _local.depth += 1
+    try:
+        yield conn
+    except BaseException:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.execute("ROLLBACK")
+        raise
+    _local.depth -= 1
+    if _local.depth == 0:
+        conn.execute("COMMIT")
+
+
+def chunked(items, size=IN_BATCH):
+    """Consecutive lists of at most `size` of `items`, e.g. to keep IN (...) lists under SQLite's limit."""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def add_missing_column(conn, table, column, declaration):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def migrate_schema(migrations):
+    """
+    Bring the schema up to date: run migrations[PRAGMA user_version:] in order, in one
+    transaction, and bump user_version. A migration may return the names of data
+    backfills it needs (long jobs); they are recorded in pending_backfills in the same
+    transaction and left to run_backfills(). An up-to-date database costs one PRAGMA read.
+    """
+    conn = get_connection()
+    if conn.execute("PRAGMA user_version").fetchone()[0] == len(migrations):
+        return
+    with transaction():
+        # Re-read under the write lock: another process may have just migrated
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > len(migrations):
+            raise RuntimeError(f"{CACHE_DB} has schema version {version}, newer than this code ({len(migrations)})")
+        conn.execute("CREATE TABLE IF NOT EXISTS pending_backfills (name TEXT PRIMARY KEY, added_at REAL)")
+        for migration in migrations[version:]:
+            conn.executemany(
+                "INSERT OR IGNORE INTO pending_backfills (name, added_at) VALUES (?, ?)",
+                [(name, time.time()) for name in migration(conn) or []]
+            )
+        conn.execute(f"PRAGMA user_version = {len(migrations)}")
+
+
+def pending_backfills():
+    """Names of the data backfills scheduled by migrations and not finished yet."""
+    try:
+        return [row[0] for row in get_connection().execute("SELECT name FROM pending_backfills")]
+    except sqlite3.OperationalError:
+        # Not migrated yet
+        return []
+
+
+def run_backfills(backfills):
+    """
+    Run the pending backfills in the order of `backfills` ({name: function}). Each one
+    is removed from pending_backfills only after it returns, so an interrupted run
+    starts it again: backfills must be safe to repeat. Returns the names run.
+    """
+    pending = set(pending_backfills())
+    done = []
+    for name, backfill in backfills.items():
+        if name in pending:
+            backfill()
+            with transaction() as conn:
+                conn.execute("DELETE FROM pending_backfills WHERE name = ?", (name,))
+            done.append(name)
+    return done
+
+
+def compact():
+    """
+    Return the free pages of riot_cache.db to the filesystem and truncate the WAL;
+    returns the bytes freed. Databases created before incremental auto-vacuum are
+    switched to it by a one-time full VACUUM.
+    """
+    conn = get_connection()
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    before = conn.execute("PRAGMA page_count").fetchone()[0]
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    else:
+        # executescript steps the pragma to completion (execute() frees a single page)
+        conn.executescript("PRAGMA incremental_vacuum;")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return (before - conn.execute("PRAGMA page_count").fetchone()[0]) * page_size
+
+
+# -- Storage codecs for the raw timeline / match_details blobs --
+# The id is stored in each row's `format` column, so rows written with different
+# codecs can live side by side. Never renumber an existing codec.
+
+def _zlib_encode(data):
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 6)
+
+def _zlib_decode(blob):
+    return json.loads(zlib.decompress(blob))
+
+def _zstd_encode(data):
+    return zstandard.ZstdCompressor(level=6).compress(json.dumps(data, separators=(",", ":")).encode())
+
+def _zstd_decode(blob):
+    return json.loads(zstandard.ZstdDecompressor().decompress(blob))
+
+def _msgpack_encode(data):
+    return zlib.compress(msgpack.packb(data), 6)
+
+def _msgpack_decode(blob):
+    return msgpack.unpackb(zlib.decompress(blob))
+
+CODECS = {
+    # id: (name, encode, decode, required module)
+    0: ("json", json.dumps, json.loads, json),
+    1: ("zlib", _zlib_encode, _zlib_decode, zlib),
+    2: ("zstd", _zstd_encode, _zstd_decode, zstandard),
+    3: ("msgpack", _msgpack_encode, _msgpack_decode, msgpack),
+}
+CODEC_IDS = dict((name, codec_id) for codec_id, (name, _, _, _) in CODECS.items())
+
+
+def get_codec_id(name=CACHE_CODEC):
+    if name not in CODEC_IDS:
+        raise ValueError(f"Unknown cache codec '{name}' (choose from {', '.join(CODEC_IDS)})")
+    codec_id = CODEC_IDS[name]
+    if CODECS[codec_id][3] is None:
+        raise ValueError(f"Cache codec '{name}' needs the '{'zstandard' if name == 'zstd' else name}' package")
+    return codec_id
+
+
+def encode_blob(data, codec_id):
+    return CODECS[codec_id][1](data)
+
+
+def decode_blob(blob, codec_id):
+    return CODECS[codec_id][2](blob)
+
+
+def migrate_cache_codec(codec_name=CACHE_CODEC, tables=("timeline", "match_details"), batch_size=200):
+    """
+    Rewrite every cached raw blob with `codec_name`, in batches of `batch_size` rows per
+    transaction. Returns {table: {rows, bytes_before, bytes_after, decode_before, decode_after}}
+    with the total decode time (seconds) of the old and new encodings.
+    """
+    codec_id = get_codec_id(codec_name)
+    conn = get_connection()
+    report = {}
+    for table in tables:
+        totals = {"rows": 0, "bytes_before": 0, "bytes_after": 0, "decode_before": 0.0, "decode_after": 0.0}
+        last_rowid = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT rowid, match_id, data, format FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            updates = []
+            for _, match_id, blob, old_id in rows:
+                start = time.perf_counter()
+                data = decode_blob(blob, old_id)
+                totals["decode_before"] += time.perf_counter() - start
+
+                new_blob = blob if old_id == codec_id else encode_blob(data, codec_id)
+                start = time.perf_counter()
+                decode_blob(new_blob, codec_id)
+                totals["decode_after"] += time.perf_counter() - start
+
+                totals["rows"] += 1
+                totals["bytes_before"] += len(blob.encode() if isinstance(blob, str) else blob)
+                totals["bytes_after"] += len(new_blob.encode() if isinstance(new_blob, str) else new_blob)
+                if old_id != codec_id:
+                    updates.append((new_blob, codec_id, match_id))
+            with transaction():
+                conn.executemany(f"UPDATE {table} SET data = ?, format = ? WHERE match_id = ?", updates)
+        report[table] = totals
+    return report
@@ -0,0 +1,293 @@
+# Compact per-match feature tables, filled once when a match is first fetched:
+# match_info (one row per match), match_participants (one row per participant),
+# participant_frames (per-frame stats of every participant) and structure_kills
+# (BUILDING_KILL events). Analysis reads only these; the raw timeline /
+# match_details blobs are cold storage and can be pruned.
+import time
+import series
+from db import get_connection, transaction, decode_blob, chunked
+
+MATCH_INFO_COLUMNS = ["match_id", "game_start_ts", "game_duration", "queue_id", "game_mode"]
+PARTICIPANT_COLUMNS = [
+    "match_id", "participant_id", "timeline_participant_id", "puuid", "team_id", "name", "tag_line", "champion",
+    "kills", "assists", "total_damage", "time_ccing_others", "scuttles", "ability_uses",
+]
+FRAME_COLUMNS = [
+    "match_id", "frame", "timestamp", "participant_id", "minions_killed", "jungle_minions_killed",
+    "total_gold", "xp", "level", "position_x", "position_y",
+]
+STRUCTURE_KILL_COLUMNS = ["match_id", "timestamp", "killer_id", "team_id", "building_type", "lane_type", "tower_type"]
+TABLES = {
+    "match_info": MATCH_INFO_COLUMNS,
+    "match_participants": PARTICIPANT_COLUMNS,
+    "participant_frames": FRAME_COLUMNS,
+    "structure_kills": STRUCTURE_KILL_COLUMNS,
+}
+
+
+def create_tables(conn):
+    """Create the feature tables; returns True if they did not exist yet."""
+    created = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'match_info'"
+    ).fetchone()[0] == 0
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS match_info (
+            match_id TEXT PRIMARY KEY,
+            game_start_ts INTEGER,
+            game_duration INTEGER,
+            queue_id INTEGER,
+            game_mode TEXT
+        )
+    ''')
+    # timeline_participant_id: position in the timeline's participant list (0 if absent),
+    # the id used by participant_frames and structure_kills.killer_id
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS match_participants (
+            match_id TEXT,
+            participant_id INTEGER,
+            timeline_participant_id INTEGER,
+            puuid TEXT,
+            team_id INTEGER,
+            name TEXT,
+            tag_line TEXT,
+            champion TEXT,
+            kills INTEGER,
+            assists INTEGER,
+            total_damage INTEGER,
+            time_ccing_others INTEGER,
+            scuttles INTEGER,
+            ability_uses INTEGER,
+            PRIMARY KEY (match_id, participant_id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS participant_frames (
+            match_id TEXT,
+            frame INTEGER,
+            timestamp INTEGER,
+            participant_id INTEGER,
+            minions_killed INTEGER,
+            jungle_minions_killed INTEGER,
+            total_gold INTEGER,
+            xp INTEGER,
+            level INTEGER,
+            position_x INTEGER,
+            position_y INTEGER,
+            PRIMARY KEY (match_id, frame, participant_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS structure_kills (
+            match_id TEXT,
+            timestamp INTEGER,
+            killer_id INTEGER,
+            team_id INTEGER,
+            building_type TEXT,
+            lane_type TEXT,
+            tower_type TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_structure_kills_match ON structure_kills (match_id)")
+    return created
+
+
+def get_participant_name(participant):
+    """Display name of a participant (Riot ID game name, or the legacy summoner name)."""
+    return participant.get('riotIdGameName') or participant.get('summonerName') or participant['puuid']
+
+
+def get_participant_riot_id(participant):
+    """
+    "gameName#tagLine" of a participant (else get_participant_name()): unlike the game
+    name alone it identifies one player, so other participants' analysis rows use it.
+    """
+    if participant.get('riotIdGameName') and participant.get('riotIdTagline'):
+        return f"{participant['riotIdGameName']}#{participant['riotIdTagline']}"
+    return get_participant_name(participant)
+
+
+def extract_features(match_id, timeline, match_details):
+    """Feature rows of one match as {table: [row tuples]}, in the column order of TABLES."""
+    info = match_details['info']
+    timeline_ids = dict((puuid, i + 1) for i, puuid in enumerate(timeline['metadata']['participants']))
+    rows = {
+        "match_info": [(match_id, info.get('gameStartTimestamp', 0), info.get('gameDuration', 0),
+                        info.get('queueId', 0), info.get('gameMode', 'Unknown'))],
+        "match_participants": [],
+        "participant_frames": [],
+        "structure_kills": [],
+    }
+    for p in info['participants']:
+        challenges = p.get('challenges', {})
+        rows["match_participants"].append((
+            match_id, p['participantId'], timeline_ids.get(p['puuid'], 0), p['puuid'], p['teamId'],
+            get_participant_name(p), p.get('riotIdTagline'), p.get('championName', 'Unknown'), p.get('kills', 0),
+            p.get('assists', 0), p.get('totalDamageDealtToChampions', 0), p.get('timeCCingOthers', 0) or 0,
+            challenges.get('scuttleCrabKills', 0), challenges.get('abilityUses', 0),
+        ))
+    for i, frame in enumerate(timeline['info']['frames']):
+        for pid, p_frame in frame['participantFrames'].items():
+            position = p_frame.get('position') or {}
+            rows["participant_frames"].append((
+                match_id, i, frame['timestamp'], int(pid), p_frame.get('minionsKilled', 0),
+                p_frame.get('jungleMinionsKilled', 0), p_frame.get('totalGold', 0), p_frame.get('xp', 0),
+                p_frame.get('level', 0), position.get('x'), position.get('y'),
+            ))
+        for event in frame.get('events', []):
+            if event['type'] == 'BUILDING_KILL':
+                rows["structure_kills"].append((
+                    match_id, event.get('timestamp'), event.get('killerId'), event.get('teamId'),
+                    event.get('buildingType'), event.get('laneType'), event.get('towerType'),
+                ))
+    return rows
+
+
+def store_features(conn, match_id, timeline, match_details):
+    """Replace the feature rows and chart series of one match (inside the caller's transaction)."""
+    write_features(conn, match_id, extract_features(match_id, timeline, match_details))
+
+
+def write_features(conn, match_id, extracted):
+    """store_features() for rows already extracted by extract_features()."""
+    for table in ("participant_frames", "structure_kills"):
+        conn.execute(f"DELETE FROM {table} WHERE match_id = ?", (match_id,))
+    for table, rows in extracted.items():
+        columns = TABLES[table]
+        conn.executemany(
+            f"REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+        )
+    series.store_series(conn, match_id, extracted["participant_frames"])
+
+
+def _select(conn, table, columns, match_ids, order):
+    for chunk in chunked(match_ids):
+        yield from conn.execute(
+            f"SELECT {', '.join(columns)} FROM {table} "
+            f"WHERE match_id IN ({','.join('?' * len(chunk))}) ORDER BY {order}", chunk
+        )
+
+
+def load_matches(match_ids, conn=None):
+    """
+    {match_id: (timeline, match_details)} for the given matches that have feature rows,
+    rebuilt as minimal Riot-shaped dicts holding just the fields the analyzers read
+    (structure kills are attached to the last frame).
+    """
+    conn = conn or get_connection()
+    match_ids = list(match_ids)
+    matches = {}
+    for match_id, start_ts, duration, queue_id, game_mode in _select(
+            conn, "match_info", MATCH_INFO_COLUMNS, match_ids, "match_id"):
+        match_details = {"metadata": {"matchId": match_id}, "info": {
+            "gameStartTimestamp": start_ts, "gameDuration": duration, "queueId": queue_id,
+            "gameMode": game_mode, "participants": [],
+        }}
+        timeline = {"metadata": {"matchId": match_id, "participants": []}, "info": {"frames": []}}
+        matches[match_id] = (timeline, match_details)
+    if not matches:
+        return matches
+    match_ids = list(matches)
+
+    timeline_puuids = dict((mid, {}) for mid in match_ids)
+    for (match_id, participant_id, timeline_id, puuid, team_id, name, tag_line, champion, kills, assists,
+         total_damage, time_ccing_others, scuttles, ability_uses) in _select(
+            conn, "match_participants", PARTICIPANT_COLUMNS, match_ids, "match_id, participant_id"):
+        matches[match_id][1]["info"]["participants"].append({
+            "puuid": puuid, "participantId": participant_id, "teamId": team_id, "riotIdGameName": name,
+            "riotIdTagline": tag_line, "championName": champion, "kills": kills, "assists": assists,
+            "totalDamageDealtToChampions": total_damage, "timeCCingOthers": time_ccing_others,
+            "challenges": {"scuttleCrabKills": scuttles, "abilityUses": ability_uses},
+        })
+        if timeline_id:
+            timeline_puuids[match_id][timeline_id] = puuid
+    for match_id, puuids in timeline_puuids.items():
+        matches[match_id][0]["metadata"]["participants"] = [puuids[i] for i in sorted(puuids)]
+
+    for (match_id, frame, timestamp, participant_id, minions, jungle_minions, gold, xp, level,
+         x, y) in _select(conn, "participant_frames", FRAME_COLUMNS, match_ids, "match_id, frame, participant_id"):
+        frames = matches[match_id][0]["info"]["frames"]
+        while len(frames) <= frame:
+            frames.append({"timestamp": timestamp, "participantFrames": {}, "events": []})
+        frames[frame]["participantFrames"][str(participant_id)] = {
+            "participantId": participant_id, "minionsKilled": minions, "jungleMinionsKilled": jungle_minions,
+            "totalGold": gold, "xp": xp, "level": level, "position": {"x": x, "y": y},
+        }
+
+    for match_id, timestamp, killer_id, team_id, building_type, lane_type, tower_type in _select(
+            conn, "structure_kills", STRUCTURE_KILL_COLUMNS, match_ids, "match_id, rowid"):
+        frames = matches[match_id][0]["info"]["frames"]
+        event = {"type": "BUILDING_KILL", "timestamp": timestamp, "killerId": killer_id, "teamId": team_id,
+                 "buildingType": building_type, "laneType": lane_type, "towerType": tower_type}
+        if frames:
+            frames[-1]["events"].append(event)
+    return matches
+
+
+def extract_from_raw(batch_size=200, reextract=False):
+    """
+    Fill the feature tables for every match in the raw cache that has none yet, or with
+    reextract rewrite them for every match whose raw JSON is still cached (e.g. after
+    a new feature column); returns the count. Pruned matches cannot be re-extracted.
+    """
+    conn = get_connection()
+    done = 0
+    last_id = ""
+    new_only = "" if reextract else "AND t.match_id NOT IN (SELECT match_id FROM match_info) "
+    while True:
+        rows = conn.execute(
+            "SELECT t.match_id, t.data, t.format, d.data, d.format FROM timeline t "
+            "JOIN match_details d ON d.match_id = t.match_id "
+            f"WHERE t.match_id > ? {new_only}"
+            "ORDER BY t.match_id LIMIT ?", (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return done
+        with transaction():
+            for match_id, t, t_format, d, d_format in rows:
+                store_features(conn, match_id, decode_blob(t, t_format), decode_blob(d, d_format))
+        last_id = rows[-1][0]
+        done += len(rows)
+
+
+def prune_raw():
+    """Delete raw timeline / match_details blobs of matches whose features are stored; returns rows deleted."""
+    deleted = 0
+    with transaction() as conn:
+        for table in ("timeline", "match_details"):
+            deleted += conn.execute(
+                f"DELETE FROM {table} WHERE match_id IN (SELECT match_id FROM match_info)"
+            ).rowcount
+    return deleted
+
+
+def apply_raw_retention(max_age_days=None, max_bytes=None):
+    """
+    Delete the raw blobs of extracted matches whose game started more than
+    `max_age_days` ago, then those of the oldest games until the raw tables hold at
+    most `max_bytes`. None skips a limit. Returns the number of matches pruned.
+    """
+    conn = get_connection()
+    doomed = set()
+    if max_age_days is not None:
+        cutoff = int((time.time() - max_age_days * 86400) * 1000)
+        doomed.update(row[0] for row in conn.execute(
+            "SELECT match_id FROM match_info WHERE game_start_ts < ? "
+            "AND (match_id IN (SELECT match_id FROM timeline) OR match_id IN (SELECT match_id FROM match_details))",
+            (cutoff,)
+        ))
+    if max_bytes is not None:
+        # Running total of raw bytes from the newest game back; everything past the budget goes
+        doomed.update(row[0] for row in conn.execute('''
+            SELECT match_id FROM (
+                SELECT i.match_id, SUM(COALESCE(LENGTH(t.data), 0) + COALESCE(LENGTH(d.data), 0))
+                    OVER (ORDER BY i.game_start_ts DESC, i.match_id) AS kept_bytes
+                FROM match_info i
+                LEFT JOIN timeline t ON t.match_id = i.match_id
+                LEFT JOIN match_details d ON d.match_id = i.match_id
+                WHERE t.match_id IS NOT NULL OR d.match_id IS NOT NULL
+            ) WHERE kept_bytes > ?
+        ''', (max_bytes,)))
+    with transaction():
+        for table in ("timeline", "match_details"):
+            conn.executemany(f"DELETE FROM {table} WHERE match_id = ?", [(mid,) for mid in doomed])
+    return len(doomed)
@@ -0,0 +1,63 @@
+# Advisory in-flight lock table shared by every process using riot_cache.db (gunicorn
+# workers, CLI runs): a match is fetched from Riot by whichever caller claims it first,
+# and the others wait for its feature rows instead of fetching it again.
+import time
+import uuid
+from config import FETCH_LOCK_STALE_SECONDS, FETCH_LOCK_POLL_SECONDS
+from db import get_connection, transaction
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fetch_locks (
+            match_id TEXT PRIMARY KEY,
+            owner TEXT,
+            acquired_at REAL
+        )
+    ''')
+
+
+def new_owner():
+    return uuid.uuid4().hex
+
+
+def claim(match_ids, owner):
+    """Lock the free (or stale) ones of match_ids for `owner`; returns the set now held by `owner`."""
+    if not match_ids:
+        return set()
+    now = time.time()
+    placeholders = ",".join("?" * len(match_ids))
+    with transaction() as conn:
+        conn.execute(
+            f"DELETE FROM fetch_locks WHERE match_id IN ({placeholders}) AND acquired_at < ?",
+            (*match_ids, now - FETCH_LOCK_STALE_SECONDS)
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO fetch_locks (match_id, owner, acquired_at) VALUES (?, ?, ?)",
+            [(mid, owner, now) for mid in match_ids]
+        )
+        return set(row[0] for row in conn.execute(
+            f"SELECT match_id FROM fetch_locks WHERE owner = ? AND match_id IN ({placeholders})",
+            (owner, *match_ids)
+        ))
+
+
+def heartbeat(owner):
+    """Keep the locks of a long-running fetch from going stale."""
+    with transaction() as conn:
+        conn.execute("UPDATE fetch_locks SET acquired_at = ? WHERE owner = ?", (time.time(), owner))
+
+
+def release(owner):
+    with transaction() as conn:
+        conn.execute("DELETE FROM fetch_locks WHERE owner = ?", (owner,))
+
+
+def wait_released(match_ids):
+    """Block until none of match_ids is locked by a live owner."""
+    placeholders = ",".join("?" * len(match_ids))
+    while get_connection().execute(
+        f"SELECT 1 FROM fetch_locks WHERE match_id IN ({placeholders}) AND acquired_at >= ? LIMIT 1",
+        (*match_ids, time.time() - FETCH_LOCK_STALE_SECONDS)
+    ).fetchone():
+        time.sleep(FETCH_LOCK_POLL_SECONDS)
@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import JOB_WORKERS, JOB_STALE_SECONDS, ANALYZE_WHOLE_MATCH
+from cli import refresh_summoner
+import metrics
+from db import get_connection, transaction
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    # Created on first use, i.e. inside the gunicorn worker and not before the fork
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="analysis-job")
+    return _executor
+
+
+def _update_job(job_id, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with transaction() as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+
+def _run_job(job_id, summoner_name, puuid, count, whole_match):
+    _update_job(job_id, status="running")
+    try:
+        with metrics.trace("job"):
+            match_ids, failures = refresh_summoner(
+                summoner_name, puuid, count, whole_match=whole_match,
+                progress=lambda completed, total: _update_job(job_id, completed=completed, total=total)
+            )
+    except Exception as e:
+        _update_job(job_id, status="failed", error=str(e))
+        return
+    result = {
+        "match_ids": match_ids,
+        "failures": [{"match_id": mid, "error": str(err)} for mid, err in failures],
+    }
+    _update_job(job_id, status="done", completed=len(match_ids), total=len(match_ids), result=json.dumps(result))
+
+
+def submit_job(summoner_name, puuid, count, whole_match=ANALYZE_WHOLE_MATCH):
+    """
+    Queue an analysis of the `count` most recent games of a summoner and return its job id.
+    If an identical job is still queued or running (in any worker), its id is returned instead.
+    """
+    job_key = f"{summoner_name}|{puuid}|{count}|{int(whole_match)}"
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT job_id FROM jobs WHERE job_key = ? AND status IN ('queued', 'running') AND updated_at > ?",
+            (job_key, now - JOB_STALE_SECONDS)
+        ).fetchone()
+        if row:
+            return row[0]
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO jobs (job_id, job_key, status, summoner_name, puuid, count, completed, total, "
+            "created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?, 0, ?, ?, ?)",
+            (job_id, job_key, summoner_name, puuid, count, count, now, now)
+        )
+    _pool().submit(_run_job, job_id, summoner_name, puuid, count, whole_match)
+    return job_id
+
+
+def get_job(job_id):
+    """Job status as a dict (None if unknown); 'result' is only set once the job is done."""
+    row = get_connection().execute(
+        "SELECT job_id, status, summoner_name, completed, total, result, error, updated_at FROM jobs WHERE job_id = ?",
+        (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    job = dict(zip(["job_id", "status", "summoner_name", "completed", "total", "result", "error", "updated_at"], row))
+    if job["status"] in ("queued", "running") and job["updated_at"] < time.time() - JOB_STALE_SECONDS:
+        # The worker process that owned this job went away
+        job["status"] = "failed"
+        job["error"] = "Job was interrupted, please submit it again."
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    del job["updated_at"]
+    return job
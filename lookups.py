@@ -0,0 +1,172 @@
+# Lookup cache for account and match lookups, shared by all processes through
+# riot_cache.db: the riot_ids table maps Riot IDs to puuids (and the player's
+# cluster), lookup_failures remembers 404s, and coalesce() merges identical
+# lookups running at the same time in one process.
+import threading
+import time
+import requests
+from config import LOOKUP_ACCOUNT_TTL
+from db import get_connection, transaction, chunked
+
+_lock = threading.Lock()
+_calls = {}  # key -> [done event, result, exception] of the lookup running for it
+
+
+class NotFoundError(LookupError):
+    """Riot answered 404 for this lookup (now or recently: see lookup_failures)."""
+
+
+def create_tables(conn):
+    # riot_id: lower-cased "gameName#tagLine"; checked_at: when Riot last confirmed it
+    # (an account lookup, or the end of a stored match the player was in)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS riot_ids (
+            riot_id TEXT PRIMARY KEY,
+            game_name TEXT,
+            tag_line TEXT,
+            puuid TEXT,
+            region TEXT,
+            checked_at REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_riot_ids_puuid ON riot_ids (puuid)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_riot_ids_game_name ON riot_ids (game_name)")
+    # expires_at NULL: never expires
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lookup_failures (
+            kind TEXT,
+            key TEXT,
+            status INTEGER,
+            expires_at REAL,
+            PRIMARY KEY (kind, key)
+        )
+    ''')
+
+
+def riot_id_key(game_name, tag_line):
+    # Riot IDs are case-insensitive
+    return f"{game_name}#{tag_line}".lower()
+
+
+def coalesce(key, lookup):
+    """
+    Return lookup(); a caller arriving while the same key is being looked up waits
+    for that call and shares its result (or exception) instead of repeating it.
+    """
+    with _lock:
+        call = _calls.get(key)
+        running = call is not None
+        if not running:
+            call = _calls[key] = [threading.Event(), None, None]
+    if running:
+        call[0].wait()
+        if call[2] is not None:
+            raise call[2]
+        return call[1]
+    try:
+        call[1] = lookup()
+    except BaseException as e:
+        call[2] = e
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call[0].set()
+    return call[1]
+
+
+def get_account(key, max_age=LOOKUP_ACCOUNT_TTL):
+    """Account dict (puuid, gameName, tagLine) of a riot_id_key confirmed within max_age seconds, or None."""
+    row = get_connection().execute(
+        "SELECT puuid, game_name, tag_line FROM riot_ids WHERE riot_id = ? AND checked_at >= ?",
+        (key, time.time() - max_age)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"puuid": row[0], "gameName": row[1], "tagLine": row[2]}
+
+
+def save_accounts(accounts, checked_at=None, region=None):
+    """
+    Record (game_name, tag_line, puuid) tuples as confirmed at `checked_at` (default
+    now), on cluster `region` if known; a mapping confirmed more recently is kept.
+    """
+    checked_at = checked_at or time.time()
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO riot_ids (riot_id, game_name, tag_line, puuid, region, checked_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (riot_id) DO UPDATE SET
+                game_name = excluded.game_name, tag_line = excluded.tag_line, puuid = excluded.puuid,
+                region = COALESCE(excluded.region, riot_ids.region), checked_at = excluded.checked_at
+            WHERE excluded.checked_at > riot_ids.checked_at
+        ''', [
+            (riot_id_key(game_name, tag_line), game_name, tag_line, puuid, region, checked_at)
+            for game_name, tag_line, puuid in accounts
+        ])
+
+
+def save_match_accounts(match_details, region):
+    """The Riot IDs of a match's participants (players of cluster `region`), as of the end of that match."""
+    info = match_details['info']
+    ended = (info.get('gameStartTimestamp', 0) / 1000) + info.get('gameDuration', 0)
+    save_accounts([
+        (p['riotIdGameName'], p['riotIdTagline'], p['puuid'])
+        for p in info['participants'] if p.get('riotIdGameName') and p.get('riotIdTagline')
+    ], ended, region)
+
+
+def puuids_by_game_name(names):
+    """{game_name: puuid} of the given names, from their most recently confirmed Riot ID."""
+    found = {}
+    conn = get_connection()
+    for chunk in chunked(names):
+        found.update(conn.execute(
+            f"SELECT game_name, puuid FROM riot_ids WHERE game_name IN ({','.join('?' * len(chunk))}) "
+            "ORDER BY checked_at",
+            chunk
+        ))
+    return found
+
+
+def get_region(puuid):
+    row = get_connection().execute(
+        "SELECT region FROM riot_ids WHERE puuid = ? AND region IS NOT NULL LIMIT 1", (puuid,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def save_region(puuid, region):
+    """Remember a player's cluster (on the Riot IDs known for them)."""
+    with transaction() as conn:
+        conn.execute("UPDATE riot_ids SET region = ? WHERE puuid = ?", (region, puuid))
+
+
+def is_not_found(error):
+    return isinstance(error, NotFoundError) or (
+        isinstance(error, requests.exceptions.HTTPError)
+        and error.response is not None and error.response.status_code == 404
+    )
+
+
+def known_failures(kind, keys):
+    """The keys among `keys` with an unexpired failure of `kind`."""
+    found = set()
+    now = time.time()
+    conn = get_connection()
+    for chunk in chunked(keys):
+        found.update(row[0] for row in conn.execute(
+            f"SELECT key FROM lookup_failures WHERE kind = ? AND key IN ({','.join('?' * len(chunk))}) "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (kind, *chunk, now)
+        ))
+    return found
+
+
+def save_failures(kind, keys, status=404, ttl=None):
+    """Remember that lookups of `keys` failed with `status`, for `ttl` seconds (None or 0: for good)."""
+    expires_at = time.time() + ttl if ttl else None
+    with transaction() as conn:
+        conn.executemany(
+            "REPLACE INTO lookup_failures (kind, key, status, expires_at) VALUES (?, ?, ?, ?)",
+            [(kind, key, status, expires_at) for key in keys]
+        )
@@ -0,0 +1,93 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from config import MEMORY_CACHE_BYTES, MEMORY_CACHE_TTLS
+
+
+def approx_size(obj):
+    """Approximate bytes held by a decoded JSON value (containers plus their contents)."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += sys.getsizeof(key) + approx_size(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += approx_size(value)
+    return size
+
+
+class MemoryCache:
+    """
+    Size-bounded in-process LRU cache in front of SQLite and the Riot API. Entries
+    are keyed by (kind, key); `ttls` maps kind -> seconds (None: never expires) and
+    the least recently used entries are evicted once `max_bytes` is exceeded.
+    Values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_bytes=MEMORY_CACHE_BYTES, ttls=MEMORY_CACHE_TTLS):
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.entries = OrderedDict()  # (kind, key) -> (value, size, expires_at)
+        self.bytes = 0
+        self.counters = {}
+
+    def _count(self, kind, counter):
+        counters = self.counters.setdefault(kind, {"hits": 0, "misses": 0, "evictions": 0, "expired": 0})
+        counters[counter] += 1
+
+    def _remove(self, entry_key):
+        _, size, _ = self.entries.pop(entry_key)
+        self.bytes -= size
+
+    def get(self, kind, key):
+        """Cached value, or None on a miss."""
+        entry_key = (kind, key)
+        with self.lock:
+            entry = self.entries.get(entry_key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove(entry_key)
+                self._count(kind, "expired")
+                entry = None
+            if entry is None:
+                self._count(kind, "misses")
+                return None
+            self.entries.move_to_end(entry_key)
+            self._count(kind, "hits")
+            return entry[0]
+
+    def set(self, kind, key, value, size=None):
+        if self.max_bytes <= 0:
+            return
+        size = size if size is not None else approx_size(value)
+        if size > self.max_bytes:
+            return
+        ttl = self.ttls.get(kind)
+        entry_key = (kind, key)
+        with self.lock:
+            if entry_key in self.entries:
+                self._remove(entry_key)
+            self.entries[entry_key] = (value, size, time.monotonic() + ttl if ttl is not None else None)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                evicted = next(iter(self.entries))
+                self._remove(evicted)
+                self._count(evicted[0], "evictions")
+
+    def stats(self):
+        """Entries and bytes held, plus hits / misses / evictions / expired per kind."""
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "kinds": dict((kind, dict(counters)) for kind, counters in self.counters.items()),
+            }
+
+
+cache = MemoryCache()
+
+
+def get_cache_stats():
+    return cache.stats()
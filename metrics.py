@@ -0,0 +1,197 @@
+# Per-stage timings and counters of the hot path (HTTP, decode, analyze, store, format),
+# request-scoped traces and an opt-in sampling profiler. Everything is in-process:
+# each gunicorn worker reports its own numbers on /metrics.
+import collections
+import contextvars
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from config import PROFILE_REQUESTS, PROFILE_DIR, PROFILE_INTERVAL_MS, TRACE_HISTORY
+
+PREFIX = "lol_analyzer"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_histograms = {}  # stage -> [bucket counts..., count, sum]
+_counters = collections.Counter()  # (name, ((label, value), ...)) -> value
+_traces = collections.deque(maxlen=TRACE_HISTORY)
+_current = contextvars.ContextVar("trace", default=None)
+
+
+def observe(stage_name, seconds):
+    """Record one duration of a stage (and add it to the current trace)."""
+    with _lock:
+        histogram = _histograms.setdefault(stage_name, [0] * len(BUCKETS) + [0, 0.0])
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += seconds
+    trace = _current.get()
+    if trace is not None:
+        trace.spans.append((stage_name, seconds))
+
+
+@contextmanager
+def stage(stage_name):
+    """Time the enclosed block as one occurrence of `stage_name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage_name, time.perf_counter() - start)
+
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        _counters[(name, tuple(sorted(labels.items())))] += amount
+
+
+class Trace:
+    """Stages timed while serving one request or job, in order."""
+
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.spans = []
+        self.profiler = None
+
+    def totals(self):
+        """{stage: (occurrences, seconds)} over the spans."""
+        totals = {}
+        for stage_name, seconds in list(self.spans):
+            n, total = totals.get(stage_name, (0, 0.0))
+            totals[stage_name] = (n + 1, total + seconds)
+        return totals
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace_id, "name": self.name, "started_at": self.started_at, "seconds": self.seconds,
+            "stages": dict((s, {"count": n, "seconds": t}) for s, (n, t) in self.totals().items()),
+        }
+
+
+def start_trace(name):
+    """Make a new trace current for this thread / context; returns (trace, token for finish_trace)."""
+    trace = Trace(name)
+    if PROFILE_REQUESTS:
+        trace.profiler = SamplingProfiler(threading.get_ident())
+        trace.profiler.start()
+    return trace, _current.set(trace)
+
+
+def finish_trace(trace, token):
+    trace.seconds = time.perf_counter() - trace.start
+    _current.reset(token)
+    if trace.profiler is not None:
+        trace.profiler.stop()
+        trace.profiler.dump(os.path.join(PROFILE_DIR, f"{trace.trace_id}.folded"))
+    observe(f"trace:{trace.name}", trace.seconds)
+    with _lock:
+        _traces.append(trace)
+
+
+@contextmanager
+def trace(name):
+    current, token = start_trace(name)
+    try:
+        yield current
+    finally:
+        finish_trace(current, token)
+
+
+def recent_traces(limit=50):
+    with _lock:
+        traces = list(_traces)[-limit:]
+    return [t.as_dict() for t in reversed(traces)]
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread every PROFILE_INTERVAL_MS and counts identical
+    stacks; dump() writes them in folded format (one "outer;...;inner count" per
+    line), readable by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self.sampler.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+
+def render_prometheus(gauges=None, counters=None):
+    """
+    All stage histograms and counters in the Prometheus text exposition format;
+    `gauges` and `counters` (totals that only grow) add {name: value} or
+    {name: {labels tuple: value}} read elsewhere.
+    """
+    lines = []
+    with _lock:
+        histograms = dict((k, list(v)) for k, v in _histograms.items())
+        totals = dict(_counters)
+    for name, value in (counters or {}).items():
+        for labels, v in (value.items() if isinstance(value, dict) else [((), value)]):
+            totals[(name, labels)] = v
+
+    lines.append(f"# HELP {PREFIX}_stage_seconds Time spent per hot-path stage.")
+    lines.append(f"# TYPE {PREFIX}_stage_seconds histogram")
+    for stage_name, histogram in sorted(histograms.items()):
+        # Bucket counts are cumulative already: observe() counts every bound >= the value
+        for bound, n in zip(BUCKETS, histogram):
+            lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage_name}",le="{bound}"}} {n}')
+        lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage_name}",le="+Inf"}} {histogram[-2]}')
+        lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage_name}"}} {histogram[-1]}')
+        lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage_name}"}} {histogram[-2]}')
+
+    for name in sorted(set(name for name, _ in totals)):
+        lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+        for (counter_name, labels), value in sorted(totals.items()):
+            if counter_name == name:
+                lines.append(f"{PREFIX}_{name}_total{_labels(labels)} {value}")
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        if isinstance(value, dict):
+            for labels, v in sorted(value.items()):
+                lines.append(f"{PREFIX}_{name}{_labels(labels)} {v}")
+        else:
+            lines.append(f"{PREFIX}_{name} {value}")
+    return "\n".join(lines) + "\n"
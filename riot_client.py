@@ -0,0 +1,237 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+from config import (
+    API_KEY, REGION, RIOT_API_BASE, RIOT_APP_RATE_LIMIT, RIOT_MAX_RETRIES,
+    HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+)
+
+# Regional routing value (cluster) serving account-v1 / match-v5 for each platform;
+# every cluster has its own rate limits
+PLATFORM_REGIONS = {
+    "NA1": "americas", "BR1": "americas", "LA1": "americas", "LA2": "americas",
+    "EUW1": "europe", "EUN1": "europe", "TR1": "europe", "RU": "europe", "ME1": "europe",
+    "KR": "asia", "JP1": "asia",
+    "OC1": "sea", "PH2": "sea", "SG2": "sea", "TH2": "sea", "TW2": "sea", "VN2": "sea",
+}
+
+
+def region_for_platform(platform, default=REGION):
+    """Cluster of a platform ID such as 'EUW1' or 'kr' (default if unknown)."""
+    return PLATFORM_REGIONS.get((platform or "").upper(), default)
+
+
+def region_for_match(match_id, default=REGION):
+    """Cluster of a match from its ID prefix ('EUW1_6543210' -> 'europe')."""
+    return region_for_platform(match_id.split("_", 1)[0] if "_" in match_id else None, default)
+
+
+def api_base(region=REGION):
+    """Base URL of a cluster; a RIOT_API_BASE without '{region}' sends every cluster to one host."""
+    return RIOT_API_BASE.replace("{region}", region)
+
+
+def parse_rate_limit(spec):
+    """Parse a Riot rate-limit header value like '20:1,100:120' into [(limit, window_seconds), ...]."""
+    limits = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        limit, window = part.split(":")
+        limits.append((int(limit), int(window)))
+    return limits
+
+
+def create_session(pool_size=HTTP_POOL_SIZE):
+    """Keep-alive session with a connection pool big enough for the fetch workers of one cluster, accepting gzip."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "X-Riot-Token": API_KEY,
+        "Accept-Encoding": "gzip, deflate",
+    })
+    return session
+
+
+class TokenBucket:
+    """`limit` requests per `window` seconds, refilled continuously."""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.rate = limit / window
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def sync(self, used):
+        """Align with the server-side count (X-*-Rate-Limit-Count), e.g. after other workers used the key."""
+        self.tokens = min(self.tokens, float(self.limit - used))
+
+
+class RateLimiter:
+    """All buckets of one scope (the app, or one method), plus any Retry-After block."""
+
+    def __init__(self, spec=None):
+        self.spec = None
+        self.buckets = []
+        self.blocked_until = 0.0
+        if spec:
+            self.update(spec)
+
+    def update(self, spec, counts=None):
+        if spec and spec != self.spec:
+            self.spec = spec
+            self.buckets = [TokenBucket(limit, window) for limit, window in parse_rate_limit(spec)]
+        if counts:
+            used = dict((window, count) for count, window in parse_rate_limit(counts))
+            for bucket in self.buckets:
+                if bucket.window in used:
+                    bucket.sync(used[bucket.window])
+
+    def wait_time(self, now):
+        wait = max(0.0, self.blocked_until - now)
+        for bucket in self.buckets:
+            wait = max(wait, bucket.wait_time(now))
+        return wait
+
+    def consume(self):
+        for bucket in self.buckets:
+            bucket.consume()
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RiotScheduler:
+    """
+    Gate for every Riot API request to one cluster. Callers queue in `acquire` until both
+    the app limiter and the limiter of the endpoint ("method") allow a request, so a
+    batch runs at the maximum allowed throughput instead of failing on a 429.
+    """
+
+    def __init__(self, app_rate_limit=RIOT_APP_RATE_LIMIT, max_retries=RIOT_MAX_RETRIES, session=None, region=REGION):
+        self.region = region
+        self.lock = threading.Lock()
+        self.session = session or create_session()
+        self.timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        self.app = RateLimiter(app_rate_limit)
+        self.methods = {}
+        self.max_retries = max_retries
+        self.counters = {
+            "requests": 0,
+            "rate_limited": 0,
+            "wait_seconds": 0.0,
+            "fetch_seconds": 0.0,
+        }
+
+    def _method(self, method):
+        if method not in self.methods:
+            self.methods[method] = RateLimiter()
+        return self.methods[method]
+
+    def acquire(self, method):
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                limiter = self._method(method)
+                wait = max(self.app.wait_time(now), limiter.wait_time(now))
+                if wait <= 0:
+                    self.app.consume()
+                    limiter.consume()
+                    self.counters["wait_seconds"] += waited
+                    if waited:
+                        metrics.observe("rate_limit_wait", waited)
+                    return
+            time.sleep(wait)
+            waited += wait
+
+    def _update_limits(self, method, headers):
+        with self.lock:
+            self.app.update(headers.get("X-App-Rate-Limit"), headers.get("X-App-Rate-Limit-Count"))
+            self._method(method).update(headers.get("X-Method-Rate-Limit"), headers.get("X-Method-Rate-Limit-Count"))
+
+    def get(self, method, url, params=None):
+        """GET `url` under the limits of `method`, retrying 429s after their Retry-After."""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(method)
+            start = time.monotonic()
+            with metrics.stage("http"):
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            metrics.inc("riot_requests", region=self.region, method=method, status=response.status_code)
+            with self.lock:
+                self.counters["requests"] += 1
+                self.counters["fetch_seconds"] += time.monotonic() - start
+            self._update_limits(method, response.headers)
+
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+
+            retry_after = float(response.headers.get("Retry-After", 1))
+            with self.lock:
+                self.counters["rate_limited"] += 1
+                if response.headers.get("X-Rate-Limit-Type") == "method":
+                    self._method(method).block(retry_after)
+                else:
+                    # "application" limits block everything; "service" 429s have no
+                    # known scope, so back off globally as well
+                    self.app.block(retry_after)
+        return response
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(region=REGION):
+    """The scheduler of one cluster: its own queue and limiters, so a throttled region never stalls another."""
+    with _schedulers_lock:
+        if region not in _schedulers:
+            # Each cluster keeps its own session: its fetch workers (up to FETCH_WORKERS,
+            # see cli._fetch_claimed) get a full connection pool even when every cluster
+            # is reached through one host (RIOT_API_BASE)
+            _schedulers[region] = RiotScheduler(region=region)
+        return _schedulers[region]
+
+
+def riot_get(method, url, params=None, region=REGION):
+    """Rate-limited GET shared by every Riot API call, queued on the scheduler of `region`."""
+    return get_scheduler(region).get(method, url, params=params)
+
+
+def get_scheduler_stats():
+    """
+    Requests made, 429s received and seconds spent waiting for the limiter vs. fetching,
+    summed over the clusters used so far, plus the same per cluster under "regions".
+    """
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    totals = {"requests": 0, "rate_limited": 0, "wait_seconds": 0.0, "fetch_seconds": 0.0, "regions": {}}
+    for region, region_scheduler in sorted(schedulers.items()):
+        region_stats = region_scheduler.stats()
+        totals["regions"][region] = region_stats
+        for key, value in region_stats.items():
+            totals[key] += value
+    return totals
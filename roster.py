@@ -0,0 +1,52 @@
+import json
+import os
+import time
+from config import CUSTOM_SUMMONERS_FILE
+from db import get_connection, transaction
+
+
+def create_tables(conn):
+    """
+    roster: the tracked summoners (dropdown of the web app, menu of the CLI, members
+    refreshed by 'refresh-roster'). On creation, entries of the old summoners.json
+    are imported.
+    """
+    created = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'roster'"
+    ).fetchone()[0] == 0
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS roster (
+            name TEXT PRIMARY KEY,
+            puuid TEXT,
+            added_at REAL,
+            refreshed_at REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_roster_puuid ON roster (puuid)")
+    if created and os.path.exists(CUSTOM_SUMMONERS_FILE):
+        with open(CUSTOM_SUMMONERS_FILE) as f:
+            legacy = json.load(f)
+        now = time.time()
+        conn.executemany(
+            "INSERT OR IGNORE INTO roster (name, puuid, added_at) VALUES (?, ?, ?)",
+            [(entry["name"], entry.get("puuid"), now) for entry in legacy.values()]
+        )
+
+
+def load_roster():
+    """Tracked summoners by name, as {name: {"name": ..., "puuid": ...}}, sorted by name."""
+    rows = get_connection().execute("SELECT name, puuid FROM roster ORDER BY name").fetchall()
+    return dict((name, {"name": name, "puuid": puuid}) for name, puuid in rows)
+
+
+def save_summoner(name, puuid):
+    """Add a summoner to the roster (an existing name is left unchanged)."""
+    with transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO roster (name, puuid, added_at) VALUES (?, ?, ?)",
+                     (name, puuid, time.time()))
+
+
+def mark_refreshed(names):
+    with transaction() as conn:
+        now = time.time()
+        conn.executemany("UPDATE roster SET refreshed_at = ? WHERE name = ?", [(now, name) for name in names])
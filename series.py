@@ -0,0 +1,122 @@
+# Per-minute chart series of every participant of a match, derived once from the
+# participant frames when a match is first stored: gold, XP, CS and position as packed
+# int32 arrays (array module, native byte order), plus a GRID x GRID heatmap of
+# positions. Charts read these few blobs instead of decoding a timeline.
+import zlib
+from array import array
+from db import get_connection, transaction, chunked
+
+# Heatmap cells per side over the Summoner's Rift coordinate range (0 .. MAP_SIZE)
+GRID = 16
+MAP_SIZE = 15000
+SERIES_COLUMNS = ["gold", "xp", "cs", "position_x", "position_y", "heatmap"]
+
+
+def create_tables(conn):
+    """Create the series table; returns True if it did not exist yet."""
+    created = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'match_series'"
+    ).fetchone()[0] == 0
+    # participant_id: the timeline participant id, as in participant_frames
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS match_series (
+            match_id TEXT,
+            participant_id INTEGER,
+            minutes INTEGER,
+            gold BLOB,
+            xp BLOB,
+            cs BLOB,
+            position_x BLOB,
+            position_y BLOB,
+            heatmap BLOB,
+            PRIMARY KEY (match_id, participant_id)
+        )
+    ''')
+    return created
+
+
+def build_series(frame_rows):
+    """
+    Series rows (match_id, participant_id, minutes, *SERIES_COLUMNS blobs) out of
+    participant_frames rows (features.FRAME_COLUMNS order) of one or more matches.
+    A frame without a position is stored as -1 and left out of the heatmap.
+    """
+    by_participant = {}
+    for match_id, frame, _, participant_id, minions, jungle, gold, xp, _, x, y in sorted(
+            frame_rows, key=lambda row: (row[0], row[3], row[1])):
+        series = by_participant.setdefault((match_id, participant_id), (
+            array("i"), array("i"), array("i"), array("i"), array("i"), array("i", [0] * (GRID * GRID))
+        ))
+        series[0].append(gold or 0)
+        series[1].append(xp or 0)
+        series[2].append((minions or 0) + (jungle or 0))
+        series[3].append(-1 if x is None else x)
+        series[4].append(-1 if y is None else y)
+        if x is not None and y is not None:
+            cell_x = min(GRID - 1, max(0, x * GRID // MAP_SIZE))
+            cell_y = min(GRID - 1, max(0, y * GRID // MAP_SIZE))
+            series[5][cell_y * GRID + cell_x] += 1
+    return [
+        (match_id, participant_id, len(series[0]), *(values.tobytes() for values in series))
+        for (match_id, participant_id), series in by_participant.items()
+    ]
+
+
+def store_series(conn, match_id, frame_rows):
+    """Replace the series of one match (inside the caller's transaction)."""
+    conn.execute("DELETE FROM match_series WHERE match_id = ?", (match_id,))
+    conn.executemany(
+        f"INSERT INTO match_series VALUES ({', '.join('?' * (len(SERIES_COLUMNS) + 3))})", build_series(frame_rows)
+    )
+
+
+def rebuild_series():
+    """Derive the series of every match that has participant frames but no series yet; returns matches done."""
+    conn = get_connection()
+    match_ids = [row[0] for row in conn.execute(
+        "SELECT DISTINCT match_id FROM participant_frames "
+        "WHERE match_id NOT IN (SELECT match_id FROM match_series)"
+    )]
+    for chunk in chunked(match_ids):
+        frame_rows = conn.execute(
+            "SELECT match_id, frame, timestamp, participant_id, minions_killed, jungle_minions_killed, "
+            "total_gold, xp, level, position_x, position_y "
+            f"FROM participant_frames WHERE match_id IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall()
+        with transaction():
+            conn.executemany(
+                f"INSERT OR REPLACE INTO match_series VALUES ({', '.join('?' * (len(SERIES_COLUMNS) + 3))})",
+                build_series(frame_rows)
+            )
+    return len(match_ids)
+
+
+def get_match_series(match_id):
+    """
+    (payload, etag) with the series of every participant of a match, or None if the
+    match has none. The etag is a checksum of the stored blobs.
+    """
+    rows = get_connection().execute(f'''
+        SELECT s.participant_id, p.puuid, p.name, p.champion, p.team_id, s.minutes,
+               {', '.join('s.' + column for column in SERIES_COLUMNS)}
+        FROM match_series s
+        LEFT JOIN match_participants p
+            ON p.match_id = s.match_id AND p.timeline_participant_id = s.participant_id
+        WHERE s.match_id = ?
+        ORDER BY s.participant_id
+    ''', (match_id,)).fetchall()
+    if not rows:
+        return None
+    checksum = 0
+    participants = []
+    for participant_id, puuid, name, champion, team_id, minutes, *blobs in rows:
+        entry = {
+            "participant_id": participant_id, "puuid": puuid, "name": name, "champion": champion,
+            "team_id": team_id, "minutes": minutes,
+        }
+        for column, blob in zip(SERIES_COLUMNS, blobs):
+            checksum = zlib.crc32(blob, checksum)
+            entry[column] = array("i", blob).tolist()
+        participants.append(entry)
+    payload = {"match_id": match_id, "grid": GRID, "map_size": MAP_SIZE, "participants": participants}
+    return payload, f"{match_id}-{checksum:08x}"
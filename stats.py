@@ -0,0 +1,164 @@
+import math
+from config import STATS_ROLLING_WINDOWS
+from db import get_connection, transaction
+
+# Aggregated 'analysis' columns. first_structure_ts is stored as 0 when no structure
+# was taken, so zeros are left out of its aggregates.
+METRICS = ["kill_participation", "minions_at_10", "total_damage_dealt", "time_ccing_others", "first_structure_ts"]
+SKIP_ZERO = {"first_structure_ts"}
+
+
+def create_tables(conn):
+    """
+    summary_stats: count, sum and sum of squares of every metric per summoner, overall
+    (scope 'all'), per champion and per game mode (key = champion / mode name), kept up
+    to date as analysis rows are written. rolling_stats: the same over each summoner's
+    last N games, for every N in STATS_ROLLING_WINDOWS.
+    """
+    created = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'summary_stats'"
+    ).fetchone()[0] == 0
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS summary_stats (
+            summoner_name TEXT,
+            scope TEXT,
+            key TEXT,
+            metric TEXT,
+            n INTEGER,
+            total REAL,
+            total_sq REAL,
+            PRIMARY KEY (summoner_name, scope, key, metric)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rolling_stats (
+            summoner_name TEXT,
+            window_size INTEGER,
+            metric TEXT,
+            n INTEGER,
+            total REAL,
+            total_sq REAL,
+            PRIMARY KEY (summoner_name, window_size, metric)
+        )
+    ''')
+    return created
+
+
+def _contributions(row):
+    """(scope, key, metric, value) of one analysis row; metric 'games' counts rows."""
+    for scope, key in (("all", ""), ("champion", row["champion"] or ""), ("mode", row["gameMode"] or "")):
+        yield scope, key, "games", 1
+        for metric in METRICS:
+            value = row[metric] or 0
+            if metric in SKIP_ZERO and not value:
+                continue
+            yield scope, key, metric, value
+
+
+def apply_row(conn, row, sign=1):
+    """Add (sign=1) or remove (sign=-1) one analysis row, given as {column: value}, from summary_stats."""
+    conn.executemany('''
+        INSERT INTO summary_stats (summoner_name, scope, key, metric, n, total, total_sq)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (summoner_name, scope, key, metric) DO UPDATE SET
+            n = n + excluded.n, total = total + excluded.total, total_sq = total_sq + excluded.total_sq
+    ''', [
+        (row["summoner_name"], scope, key, metric, sign, sign * value, sign * value * value)
+        for scope, key, metric, value in _contributions(row)
+    ])
+
+
+def _window_sql():
+    # Zeros add nothing to the sums, so skipping them only changes the count
+    columns = ["COUNT(*)"]
+    for metric in METRICS:
+        value = f"COALESCE({metric}, 0)"
+        count = f"SUM({value} != 0)" if metric in SKIP_ZERO else "COUNT(*)"
+        columns.append(f"{count}, COALESCE(SUM({value}), 0), COALESCE(SUM({value} * {value}), 0)")
+    return (
+        f"SELECT {', '.join(columns)} FROM (SELECT {', '.join(METRICS)} FROM analysis "
+        f"WHERE summoner_name = ? ORDER BY game_start_ts DESC LIMIT ?)"
+    )
+
+
+def refresh_rolling(conn, summoner_name, game_start_ts=None):
+    """
+    Recompute the last-N windows of a summoner. With `game_start_ts` (of a row just
+    written) nothing is done unless that game falls inside the largest window, so
+    backfilling old games costs one index lookup.
+    """
+    largest = max(STATS_ROLLING_WINDOWS)
+    if game_start_ts is not None:
+        newer = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM analysis WHERE summoner_name = ? AND game_start_ts > ? LIMIT ?)",
+            (summoner_name, game_start_ts, largest)
+        ).fetchone()[0]
+        if newer >= largest:
+            return
+
+    rows = []
+    for window in STATS_ROLLING_WINDOWS:
+        games, *aggregates = conn.execute(_window_sql(), (summoner_name, window)).fetchone()
+        rows.append((summoner_name, window, "games", games, games, games))
+        for i, metric in enumerate(METRICS):
+            rows.append((summoner_name, window, metric, *aggregates[i * 3:i * 3 + 3]))
+    conn.executemany("REPLACE INTO rolling_stats VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def rebuild_stats():
+    """Recompute summary_stats and rolling_stats from scratch out of the 'analysis' table."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM summary_stats")
+        conn.execute("DELETE FROM rolling_stats")
+        for scope, key in (("all", "''"), ("champion", "COALESCE(champion, '')"), ("mode", "COALESCE(gameMode, '')")):
+            conn.execute(f'''
+                INSERT INTO summary_stats
+                SELECT summoner_name, '{scope}', {key}, 'games', COUNT(*), COUNT(*), COUNT(*)
+                FROM analysis GROUP BY summoner_name, {key}
+            ''')
+            for metric in METRICS:
+                value = f"COALESCE({metric}, 0)"
+                condition = f"WHERE {value} != 0" if metric in SKIP_ZERO else ""
+                conn.execute(f'''
+                    INSERT INTO summary_stats
+                    SELECT summoner_name, '{scope}', {key}, '{metric}',
+                           COUNT(*), SUM({value}), SUM({value} * {value})
+                    FROM analysis {condition} GROUP BY summoner_name, {key}
+                ''')
+        for (summoner_name,) in conn.execute("SELECT DISTINCT summoner_name FROM analysis").fetchall():
+            refresh_rolling(conn, summoner_name)
+
+
+def _describe(n, total, total_sq):
+    if not n:
+        return {"n": 0, "mean": None, "std": None}
+    mean = total / n
+    variance = max(0.0, total_sq / n - mean * mean)
+    return {"n": n, "mean": mean, "std": math.sqrt(variance)}
+
+
+def get_summoner_stats(summoner_name):
+    """
+    Aggregates of a summoner read straight from the summary tables:
+    {"overall": {metric: {n, mean, std}}, "by_champion": {champion: {...}},
+     "by_mode": {mode: {...}}, "rolling": {"last_10": {...}, ...}}.
+    """
+    conn = get_connection()
+    result = {"overall": {}, "by_champion": {}, "by_mode": {}, "rolling": {}}
+    groups = {"all": None, "champion": "by_champion", "mode": "by_mode"}
+    for scope, key, metric, n, total, total_sq in conn.execute(
+        "SELECT scope, key, metric, n, total, total_sq FROM summary_stats WHERE summoner_name = ? AND n > 0",
+        (summoner_name,)
+    ):
+        if scope == "all":
+            target = result["overall"]
+        else:
+            target = result[groups[scope]].setdefault(key, {})
+        target[metric] = n if metric == "games" else _describe(n, total, total_sq)
+    for window, metric, n, total, total_sq in conn.execute(
+        "SELECT window_size, metric, n, total, total_sq FROM rolling_stats WHERE summoner_name = ?",
+        (summoner_name,)
+    ):
+        target = result["rolling"].setdefault(f"last_{window}", {})
+        target[metric] = n if metric == "games" else _describe(n, total, total_sq)
+    return result
@@ -0,0 +1,108 @@
+# Every timeline metric is an extractor subscribing to frame snapshots and/or event
+# types; run_extractors() walks the frames and events once for all of them, so adding
+# a metric does not add another traversal of the timeline.
+
+EXTRACTORS = []
+
+
+def register(cls):
+    """Class decorator adding an extractor to the set run by default."""
+    EXTRACTORS.append(cls)
+    return cls
+
+
+class TimelineExtractor:
+    """
+    Base class for timeline metrics. Subclasses set `name`, subscribe through
+    `wants_frames` / `event_types`, and return their value from result().
+    `index` is the cli.MatchIndex of the match (participant -> team lookups).
+    """
+    name = None
+    wants_frames = False
+    event_types = ()
+
+    def __init__(self, timeline, index):
+        self.timeline = timeline
+        self.index = index
+
+    def on_frame(self, frame):
+        pass
+
+    def on_event(self, event):
+        pass
+
+    def result(self):
+        raise NotImplementedError
+
+
+def run_extractors(timeline, index, extractors=None):
+    """Run the given (default: all registered) extractors over one timeline; returns {name: result}."""
+    instances = [cls(timeline, index) for cls in (extractors if extractors is not None else EXTRACTORS)]
+    frame_subscribers = [e for e in instances if e.wants_frames]
+    event_subscribers = {}
+    for e in instances:
+        for event_type in e.event_types:
+            event_subscribers.setdefault(event_type, []).append(e)
+
+    for frame in timeline['info']['frames']:
+        for e in frame_subscribers:
+            e.on_frame(frame)
+        if event_subscribers:
+            for event in frame.get('events', []):
+                for e in event_subscribers.get(event['type'], ()):
+                    e.on_event(event)
+
+    return dict((e.name, e.result()) for e in instances)
+
+
+@register
+class MinionsAt10(TimelineExtractor):
+    """minionsKilled per participantId in the first frame at/after 10 minutes (or the last frame)."""
+    name = "minions_at_10"
+    wants_frames = True
+    target_time = 600000  # 10 min in ms
+
+    def __init__(self, timeline, index):
+        super().__init__(timeline, index)
+        self.chosen_frame = None
+        self.last_frame = None
+
+    def on_frame(self, frame):
+        if self.chosen_frame is None:
+            if frame['timestamp'] >= self.target_time:
+                self.chosen_frame = frame
+            self.last_frame = frame
+
+    def result(self):
+        frame = self.chosen_frame or self.last_frame
+        if frame is None:
+            return {}
+        return dict(
+            (int(pid), p_frame.get('minionsKilled', 0))
+            for pid, p_frame in frame['participantFrames'].items()
+        )
+
+
+@register
+class FirstStructure(TimelineExtractor):
+    """Timestamp (ms) of the first building each team destroyed, by teamId."""
+    name = "first_structure"
+    event_types = ('BUILDING_KILL',)
+
+    def __init__(self, timeline, index):
+        super().__init__(timeline, index)
+        self.first_ts = {}
+
+    def on_event(self, event):
+        killer_id = event.get('killerId')
+        if killer_id is None:
+            return
+        team_id = self.index.team_by_participant_id.get(killer_id)
+        t = event.get('timestamp')
+        if team_id is None or t is None:
+            return
+        if team_id not in self.first_ts or t < self.first_ts[team_id]:
+            self.first_ts[team_id] = t
+
+    def result(self):
+        return self.first_ts